@@ -0,0 +1,66 @@
+'''
+Benchmark of the validation of an alert against compiled rules
+
+    python benchmarks/rules.py [rules] [number]
+
+..  codeauthor:: Charles Blais
+'''
+import sys
+
+import timeit
+
+from pyoasiscap.alert import Status
+
+from pyravealert.inbound import generate
+
+from pyravealert.rules import DEFAULT_RULES, Rule, RuleSet
+
+
+def make_rules(count: int):
+    '''
+    Default rules followed by a mix of regex, equality and scoped rules
+    '''
+    rules = list(DEFAULT_RULES)
+    for i in range(count - len(rules)):
+        kind = i % 4
+        if kind == 0:
+            rules.append(Rule(
+                field='info.headline', operator='not_matches',
+                value=rf'(?i)forbidden phrase {i}\b',
+                message=f'Forbidden phrase {i}'))
+        elif kind == 1:
+            rules.append(Rule(
+                field='info.event', operator='not_equals',
+                value=f'Retired event {i}', message=f'Retired event {i}'))
+        elif kind == 2:
+            rules.append(Rule(
+                field='info[0].instruction', operator='not_matches',
+                value=rf'placeholder {i}', message=f'Placeholder {i}',
+                status=['Actual']))
+        else:
+            rules.append(Rule(
+                field='info.parameter.valueName', operator='not_matches',
+                value=rf'^internal:{i}:', message=f'Internal parameter {i}',
+                category=['Met']))
+    return rules
+
+
+def main(count: int = 120, number: int = 10000):
+    alert = generate(
+        status=Status.actual,
+        event='Earthquake',
+        headline='Earthquake near the coast',
+        description='EN --- FR',
+        instruction='Drop, cover and hold on',
+    )
+    start = timeit.default_timer()
+    rules = RuleSet(make_rules(count))
+    compiled = timeit.default_timer() - start
+    print(f'compiled {count} rules in {compiled * 1e3:.1f} ms')
+
+    elapsed = timeit.timeit(lambda: rules.validate(alert), number=number)
+    print(f'{"validate":<22}{elapsed / number * 1e6:10.1f} us/alert')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
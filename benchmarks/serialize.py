@@ -0,0 +1,45 @@
+'''
+Benchmark of the CAP serialization paths
+
+    python benchmarks/serialize.py [number]
+
+..  codeauthor:: Charles Blais
+'''
+import sys
+
+import timeit
+
+from pyoasiscap.cap import to_string
+
+from pyravealert.inbound import generate, AlertTemplate
+
+
+def main(number: int = 10000):
+    kwargs = {
+        'event': 'Earthquake',
+        'instruction': 'Drop, cover and hold on',
+        'contact': 'earthquakeinfo-infoseisme@nrcan-rncan.gc.ca',
+    }
+    template = AlertTemplate(**kwargs)
+
+    def generate_to_string():
+        to_string(generate(
+            headline='Region', description='EN --- FR', **kwargs))
+
+    def stamp_to_string():
+        to_string(template.stamp(headline='Region', description='EN --- FR'))
+
+    def render():
+        template.render(headline='Region', description='EN --- FR')
+
+    for name, function in [
+        ('generate + to_string', generate_to_string),
+        ('stamp + to_string', stamp_to_string),
+        ('render', render),
+    ]:
+        elapsed = timeit.timeit(function, number=number)
+        print(f'{name:<22}{elapsed / number * 1e6:10.1f} us/alert')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
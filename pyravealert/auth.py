@@ -0,0 +1,91 @@
+'''
+Basic auth credential store for the CAP receiver
+
+Secrets are hashed once when the store is built (or accepted already
+hashed) and successful verifications are cached for a short time so
+repeat submitters do not pay the key derivation cost on every request.
+
+..  codeauthor:: Charles Blais
+'''
+import hashlib
+
+import hmac
+
+import secrets
+
+import threading
+
+import time
+
+from typing import Dict, Tuple
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# Prefixes of the hashing methods produced by werkzeug
+HASH_METHODS = ('pbkdf2:', 'scrypt:')
+
+
+def is_password_hash(secret: str) -> bool:
+    '''
+    Check if the secret is a werkzeug password hash (method$salt$hash)
+    '''
+    return secret.startswith(HASH_METHODS) and secret.count('$') == 2
+
+
+class CredentialStore:
+    '''
+    Username to password hash mapping with a verification cache
+
+    :param credentials: username to plaintext password or werkzeug hash
+    :param ttl: seconds a successful verification is cached (0 disables)
+    :param max_cache: maximum number of cached verifications
+    '''
+    def __init__(
+        self,
+        credentials: Dict[str, str],
+        ttl: float = 60.0,
+        max_cache: int = 1024,
+    ):
+        self.hashes = {
+            username: secret if is_password_hash(secret)
+            else generate_password_hash(secret)
+            for username, secret in credentials.items()
+        }
+        self.ttl = ttl
+        self.max_cache = max_cache
+        # Cache entries are keyed on a keyed digest so the plaintext
+        # password is never kept in memory
+        self._key = secrets.token_bytes(32)
+        self._cache: Dict[Tuple[str, bytes], float] = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, password: str) -> bytes:
+        return hmac.new(
+            self._key, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def verify(self, username: str, password: str) -> bool:
+        '''
+        Verify the username and password
+        '''
+        if username not in self.hashes:
+            return False
+
+        key = (username, self._digest(password))
+        now = time.monotonic()
+        with self._lock:
+            expires = self._cache.get(key)
+        if expires is not None and expires > now:
+            return True
+
+        if not check_password_hash(self.hashes[username], password):
+            return False
+
+        if self.ttl > 0:
+            with self._lock:
+                if len(self._cache) >= self.max_cache:
+                    self._cache = {
+                        k: v for k, v in self._cache.items() if v > now}
+                if len(self._cache) < self.max_cache:
+                    self._cache[key] = now + self.ttl
+        return True
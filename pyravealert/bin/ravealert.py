@@ -1,46 +1,90 @@
 '''
+The command is run often by legacy scripts so its startup is kept short:
+the settings are only read when the command runs (option defaults are
+resolved lazily) and the HTTP client, the XML serialization and the
+outbox are only imported on the code paths that use them.
+
 ..  codeauthor:: Charles Blais
 '''
 import logging
 
-from typing import List, Optional
+import os
 
-import click
+import sys
 
-from pyravealert import inbound
+import time
 
-from pyoasiscap.cap import to_string, from_file
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+
+import click
 
 from pyoasiscap.parameter import Parameter
 
-from pyoasiscap.alert import Status, Scope
+from pyoasiscap.alert import Alert, Status, Scope
 
 from pyoasiscap.info import ResponseType, Category
 
 from pyravealert.config import get_app_settings, LogLevels
 
+if TYPE_CHECKING:
+    from pyravealert.client import InboundClient
 
-settings = get_app_settings()
+    from pyravealert.outbox import Outbox
 
 
-@click.command()
+# seconds the response of the daemon may arrive after its deadline
+FORWARD_MARGIN = 1.0
+
+
+def _setting(name: str) -> Callable[[], Any]:
+    '''
+    Option default read from the settings when the command runs
+    '''
+    return lambda: getattr(get_app_settings(), name)
+
+
+def _check_files(paths: List[str]) -> List[str]:
+    '''
+    Reject the paths, other than - and globs, that do not exist
+    '''
+    for path in paths:
+        if path != '-' and not any(c in path for c in '*?[') and \
+                not os.path.exists(path):
+            raise click.BadParameter(f"Path '{path}' does not exist.")
+    return paths
+
+
+@click.group(invoke_without_command=True)
 @click.option(
     '--url',
-    default=settings.url,
+    default=_setting('url'),
     help='Rave Alert CAP Inbound URL'
 )
 @click.option(
     '--username',
-    default=settings.username,
+    default=_setting('username'),
 )
 @click.option(
     '--password',
-    default=settings.password,
+    default=_setting('password'),
 )
 @click.option(
     '--file',
-    type=click.Path(exists=True),
-    help='Get CAP content from file',
+    multiple=True,
+    callback=lambda ctx, param, value: _check_files(value),
+    help='Get CAP content from file.  Repeat it, or give a directory, a '
+    'glob or - (CAP documents on stdin) to send many files',
+)
+@click.option(
+    '--concurrency',
+    type=int,
+    default=_setting('send_concurrency'),
+    help='Number of alerts sent in parallel with many files',
+)
+@click.option(
+    '--jobs',
+    type=int,
+    help='Number of processes parsing many files (default to CPUs)',
 )
 @click.option(
     '-e', '--event',
@@ -107,16 +151,50 @@ settings = get_app_settings()
     is_flag=True,
     help='stdout only output (do not send)'
 )
+@click.option(
+    '--connect-timeout',
+    type=float,
+    default=_setting('connect_timeout'),
+    help='Connection timeout in seconds',
+)
+@click.option(
+    '--read-timeout',
+    type=float,
+    default=_setting('read_timeout'),
+    help='Read timeout in seconds',
+)
+@click.option(
+    '--retries',
+    type=int,
+    default=_setting('retries'),
+    help='Retries on server or connection errors',
+)
+@click.option(
+    '--deadline',
+    type=float,
+    default=_setting('deadline'),
+    help='Give up sending after this many seconds',
+)
+@click.option(
+    '--outbox',
+    type=click.Path(dir_okay=False),
+    default=_setting('outbox'),
+    help='Journal alerts in this outbox database before sending',
+)
 @click.option(
     '--log-level',
     type=click.Choice([v.value for v in LogLevels]),
     help='Verbosity'
 )
+@click.pass_context
 def main(
+    ctx: click.Context,
     url: str,
     username: str,
     password: str,
-    file: Optional[str],
+    file: List[str],
+    concurrency: int,
+    jobs: Optional[int],
     event: Optional[str],
     headline: Optional[str],
     description: Optional[str],
@@ -130,6 +208,11 @@ def main(
     response_type: List[str],
     parameter: List[str],
     stdout_only: bool,
+    connect_timeout: float,
+    read_timeout: float,
+    retries: int,
+    deadline: float,
+    outbox: Optional[str],
     log_level: str,
 ):
     '''
@@ -153,54 +236,371 @@ def main(
         areaDesc = empty
         geocode = empty
 
+    Alerts journaled in the outbox (--outbox) that could not be delivered
+    are managed with the outbox command.
     '''
+    settings = get_app_settings()
     if log_level is not None:
         settings.log_level = LogLevels(log_level)
     if username is not None:
         settings.username = username
     if password is not None:
         settings.password = password
+    settings.connect_timeout = connect_timeout
+    settings.read_timeout = read_timeout
+    settings.retries = retries
+    settings.deadline = deadline
+    settings.url = url
+    settings.outbox = outbox
     settings.configure_logging()
 
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if file:
+        from pyravealert import bulk
+
+        if bulk.is_bulk(file):
+            _send_files(file, stdout_only, concurrency, jobs)
+            return
+    path = file[0] if file else None
+    if path is None and event is None:
+        raise ValueError('event is not set')
+    alert = dict(
+        status=status,
+        scope=scope,
+        event=event,
+        language=language,
+        category=list(category),
+        response_type=list(response_type),
+        headline=headline,
+        description=description,
+        instruction=instruction,
+        web=web,
+        contact=contact,
+        parameter=list(parameter),
+    )
+
+    if not stdout_only and outbox is None and settings.daemon_forward:
+        if settings.username is None or settings.password is None:
+            raise ValueError('username/password not set')
+        if _forward(alert, path):
+            return
+
+    from pyoasiscap.cap import to_string, from_file
+
+    cap = _build_alert(alert) if path is None else from_file(path)
+
+    logging.debug('Generated CAP content: %s', cap)
+
+    if stdout_only:
+        print(to_string(cap))
+    else:
+        if settings.username is None or settings.password is None:
+            raise ValueError('username/password not set')
+        if outbox is None:
+            _get_client().send(cap)
+            return
+        box = _get_outbox()
+        entry = box.put(cap.identifier, to_string(cap))
+        counts = box.drain(_get_client(), ids=[entry])
+        if counts['delivered'] == 0:
+            raise RuntimeError(
+                f'{cap.identifier} not delivered, kept in outbox {entry}')
+
+
+def _send_files(
+    files: List[str],
+    stdout_only: bool,
+    concurrency: int,
+    jobs: Optional[int],
+):
+    '''
+    Send (or print) the CAP documents of many files
+
+    Prints the outcome of each document then the totals and throughput.
+    '''
+    from pyoasiscap.cap import to_string
+
+    from pyravealert import bulk
+
+    start = time.monotonic()
+    loaded = list(bulk.load(files, sys.stdin.buffer, jobs))
+    alerts = [cap for _, cap, _ in loaded if cap is not None]
+    failed = len(alerts) != len(loaded)
+    if stdout_only:
+        for cap in alerts:
+            print(to_string(cap))
+    elif get_app_settings().outbox is not None:
+        box = _get_outbox()
+        entries = [box.put(cap.identifier, to_string(cap)) for cap in alerts]
+        counts = box.drain(_get_client(), concurrency, ids=entries)
+        for name, cap, error in loaded:
+            outcome = 'queued' if cap is not None else f'invalid: {error}'
+            print(f'{name}\t{outcome}')
+        elapsed = time.monotonic() - start
+        print(
+            ', '.join(f'{count} {state}' for state, count in counts.items())
+            + f', {len(loaded) - len(alerts)} invalid in {elapsed:.2f}s '
+            f'({counts["delivered"] / elapsed:.1f} alerts/s)')
+        failed = failed or counts['delivered'] != len(alerts)
+    else:
+        results = iter(_get_client().send_many(alerts, concurrency))
+        sent = errors = 0
+        for name, cap, error in loaded:
+            if cap is None:
+                print(f'{name}\t-\tinvalid: {error}')
+                continue
+            result = next(results)
+            if result.duplicate:
+                outcome = 'duplicate'
+            elif result.ok:
+                outcome = f'sent {result.status_code}'
+                sent += 1
+            else:
+                outcome = f'failed: {result.error}'
+                errors += 1
+            print(f'{name}\t{result.identifier}\t{outcome}')
+        elapsed = time.monotonic() - start
+        print(
+            f'{sent} sent, {errors} failed, '
+            f'{len(loaded) - len(alerts)} invalid in {elapsed:.2f}s '
+            f'({len(alerts) / elapsed:.1f} alerts/s)')
+        failed = failed or errors > 0
+    if failed:
+        sys.exit(1)
+
+
+def _build_alert(alert: Dict[str, Any]) -> Alert:
+    '''
+    Generate the alert from the command arguments
+    '''
+    from pyravealert import inbound
+
     params = []
-    for param in parameter:
+    for param in alert['parameter']:
         parts = param.split('=')
         if len(parts) != 2:
             raise ValueError(f'Invalid parameter format {param}')
         params.append(Parameter(
             valueName=parts[0], value=parts[1]
         ))
+    return inbound.generate(
+        status=Status(alert['status']),
+        scope=Scope(alert['scope']),
+        event=alert['event'],
+        language=alert['language'],
+        category=[Category(c) for c in alert['category']],
+        responseType=[ResponseType(r) for r in alert['response_type']],
+        headline=alert['headline'],
+        description=alert['description'],
+        instruction=alert['instruction'],
+        web=alert['web'],
+        contact=alert['contact'],
+        parameter=params,
+    )
 
-    if file is None:
-        if event is None:
-            raise ValueError('event is not set')
-        cap = inbound.generate(
-            status=Status(status),
-            scope=Scope(scope),
-            event=event,
-            language=language,
-            category=[Category(c) for c in category],
-            responseType=[ResponseType(r) for r in response_type],
-            headline=headline,
-            description=description,
-            instruction=instruction,
-            web=web,
-            contact=contact,
-            parameter=params,
-        )
-    else:
-        cap = from_file(file)
 
-    logging.debug(f'Generated CAP content: {cap}')
+def _forward(alert: Dict[str, Any], file: Optional[str]) -> bool:
+    '''
+    Have the daemon send the alert
 
-    if stdout_only:
-        print(to_string(cap))
+    The daemon sends it with the url, credentials, timeouts, retries and
+    deadline of this invocation.  The file is read only once a daemon is
+    connected and passed as is, the daemon parses it.
+
+    :returns: False if no daemon is running
+    '''
+    from pyravealert.daemon import connect, exchange
+
+    settings = get_app_settings()
+    # the daemon gives up once the deadline has passed and its last
+    # attempt timed out
+    sock = connect(settings.daemon_socket, timeout=(
+        settings.deadline + settings.connect_timeout +
+        settings.read_timeout + FORWARD_MARGIN))
+    if sock is None:
+        logging.debug('No daemon on %s, sending', settings.daemon_socket)
+        return False
+    request = {
+        'url': settings.url,
+        'username': settings.username,
+        'password': settings.password,
+        'connect_timeout': settings.connect_timeout,
+        'read_timeout': settings.read_timeout,
+        'retries': settings.retries,
+        'deadline': settings.deadline,
+        'alert': alert,
+    }
+    if file is not None:
+        import base64
+
+        with open(file, 'rb') as fh:
+            request['content'] = base64.b64encode(fh.read()).decode('ascii')
+    response = exchange(sock, request)
+    if 'error' in response:
+        raise RuntimeError(f'Daemon failed to send: {response["error"]}')
+    logging.info('Daemon sent %s', response['identifier'])
+    return True
+
+
+def _serve_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Send the alert forwarded to the daemon
+    '''
+    import base64
+
+    from pyoasiscap.cap import from_string
+
+    from pyravealert.client import get_inbound_client
+
+    if 'content' in request:
+        cap = from_string(base64.b64decode(request['content']))
     else:
-        if settings.username is None or settings.password is None:
-            raise ValueError('username/password not set')
-        inbound.send(
-            cap,
-            url,
-            username,
-            password
-        )
+        cap = _build_alert(request['alert'])
+    client = get_inbound_client(
+        request['url'],
+        request['username'],
+        request['password'],
+        connect_timeout=request.get('connect_timeout'),
+        read_timeout=request.get('read_timeout'),
+        retries=request.get('retries'),
+        deadline=request.get('deadline'),
+    )
+    response = client.send(cap)
+    return {
+        'identifier': cap.identifier,
+        'status_code': None if response is None else response.status_code,
+    }
+
+
+def _get_client() -> 'InboundClient':
+    from pyravealert.client import get_inbound_client
+
+    settings = get_app_settings()
+    if settings.username is None or settings.password is None:
+        raise ValueError('username/password not set')
+    return get_inbound_client(
+        settings.url, settings.username, settings.password)
+
+
+def _get_outbox() -> 'Outbox':
+    from pyravealert.outbox import Outbox
+
+    settings = get_app_settings()
+    if settings.outbox is None:
+        raise ValueError('outbox is not set')
+    return Outbox(
+        settings.outbox,
+        batch=settings.outbox_batch,
+        lease=settings.outbox_lease,
+    )
+
+
+@main.command('serve')
+@click.option(
+    '--socket',
+    'path',
+    default=_setting('daemon_socket'),
+    help='Unix domain socket to listen on',
+)
+def serve(path: str):
+    '''
+    Run a daemon sending the alerts of other ravealert invocations.
+
+    ravealert forwards its alert to the daemon listening on the
+    daemon_socket setting instead of sending it itself, saving the
+    startup and connection costs.  The alerts are sent with the url,
+    credentials, timeouts, retries and deadline of the forwarding
+    invocation.
+    '''
+    import signal
+
+    from pyravealert.daemon import Daemon
+
+    daemon = Daemon(path, _serve_request)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    settings = get_app_settings()
+    if settings.username is not None and settings.password is not None:
+        _get_client()
+    logging.info('Listening on %s', path)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+@main.group('outbox')
+def outbox_command():
+    '''
+    Manage the alerts journaled in the outbox.
+    '''
+
+
+@outbox_command.command('list')
+@click.option(
+    '--state',
+    type=click.Choice(['pending', 'in_flight', 'delivered', 'failed']),
+    help='Only entries in this state',
+)
+@click.option(
+    '--limit',
+    type=int,
+    default=100,
+    help='Maximum number of entries',
+)
+def outbox_list(state: Optional[str], limit: int):
+    '''
+    List the outbox entries.
+    '''
+    for entry in _get_outbox().list(state=state, limit=limit):
+        print('\t'.join(str(entry[key]) for key in (
+            'id', 'identifier', 'state', 'attempts', 'last_error')))
+
+
+@outbox_command.command('drain')
+@click.option(
+    '--concurrency',
+    type=int,
+    default=_setting('outbox_concurrency'),
+    help='Number of alerts sent in parallel',
+)
+@click.option(
+    '--watch',
+    is_flag=True,
+    help='Keep draining periodically until interrupted',
+)
+@click.option(
+    '--interval',
+    type=float,
+    default=_setting('outbox_interval'),
+    help='Seconds between drains with --watch',
+)
+def outbox_drain(concurrency: int, watch: bool, interval: float):
+    '''
+    Deliver the pending outbox entries.
+    '''
+    from pyravealert.outbox import Drainer
+
+    if watch:
+        Drainer(
+            _get_outbox(),
+            _get_client(),
+            interval=interval,
+            concurrency=concurrency,
+        ).run()
+        return
+    counts = _get_outbox().drain(_get_client(), concurrency=concurrency)
+    print(', '.join(f'{count} {state}' for state, count in counts.items()))
+
+
+@outbox_command.command('replay')
+@click.argument('ids', type=int, nargs=-1)
+def outbox_replay(ids: List[int]):
+    '''
+    Mark entries (all failed ones by default) pending again.
+    '''
+    count = _get_outbox().replay(ids if ids else None)
+    print(f'{count} entries pending')
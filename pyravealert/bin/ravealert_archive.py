@@ -0,0 +1,156 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import sys
+
+from typing import Optional
+
+import click
+
+from pyravealert.config import get_app_settings, ArchiveLayout, LogLevels
+
+from pyravealert.index import ArchiveIndex
+
+from pyravealert.storage import AlertStore
+
+
+settings = get_app_settings()
+
+
+@click.group()
+@click.option(
+    '--directory',
+    default=settings.ws_write_directory,
+    help='Directory of the CAP receiver store',
+)
+@click.option(
+    '--log-level',
+    type=click.Choice([v.value for v in LogLevels]),
+    help='Verbosity'
+)
+@click.pass_context
+def main(ctx: click.Context, directory: str, log_level: str):
+    '''
+    Query the alerts stored by the CAP receiver web service.
+    '''
+    if log_level is not None:
+        settings.log_level = LogLevels(log_level)
+    settings.configure_logging()
+    ctx.obj = AlertStore(
+        directory,
+        index=settings.ws_index,
+        layout=settings.ws_archive_layout,
+    )
+
+
+def _index(store: AlertStore) -> ArchiveIndex:
+    if store.index is None:
+        raise click.ClickException(
+            'The index is disabled (ws_index setting)')
+    return store.index
+
+
+@main.command('list')
+@click.option('--status', help='Status of the alerts')
+@click.option('--event', help='Event of the alerts')
+@click.option('--category', help='Category of the alerts')
+@click.option('--sender', help='Sender of the alerts')
+@click.option('--since', help='Sent at or after this ISO 8601 time')
+@click.option('--until', help='Sent before this ISO 8601 time')
+@click.option(
+    '--limit',
+    type=int,
+    default=100,
+    help='Maximum number of alerts',
+)
+@click.pass_obj
+def archive_list(
+    store: AlertStore,
+    status: Optional[str],
+    event: Optional[str],
+    category: Optional[str],
+    sender: Optional[str],
+    since: Optional[str],
+    until: Optional[str],
+    limit: int,
+):
+    '''
+    List the stored alerts matching all the criteria, last sent first.
+    '''
+    for entry in _index(store).search(
+        status=status,
+        event=event,
+        category=category,
+        sender=sender,
+        since=since,
+        until=until,
+        limit=limit,
+    ):
+        print('\t'.join([
+            entry['sent'], entry['status'], entry['identifier'],
+            str(entry['event']), ','.join(entry['category']),
+        ]))
+
+
+@main.command('fetch')
+@click.argument('identifier')
+@click.pass_obj
+def archive_fetch(store: AlertStore, identifier: str):
+    '''
+    Print the stored CAP alert.
+    '''
+    content = store.read(identifier)
+    if content is None:
+        raise click.ClickException(f'Unknown {identifier}')
+    sys.stdout.buffer.write(content)
+
+
+@main.command('reindex')
+@click.pass_obj
+def archive_reindex(store: AlertStore):
+    '''
+    Rebuild the index from the stored files.
+
+    Required once for alerts stored before the index was enabled.
+    '''
+    _index(store)
+    print(f'{store.reindex()} alerts indexed')
+
+
+@main.command('migrate')
+@click.option(
+    '--layout',
+    type=click.Choice([v.value for v in ArchiveLayout]),
+    default=settings.ws_archive_layout.value,
+    help='Layout to move the stored files to',
+)
+@click.pass_obj
+def archive_migrate(store: AlertStore, layout: str):
+    '''
+    Move the stored files to another archive layout.
+
+    Stop the web service first and set its ws_archive_layout setting to
+    the new layout before restarting it.
+    '''
+    store.layout = ArchiveLayout(layout)
+    if store.layout is ArchiveLayout.DATE and store.index is None:
+        raise click.ClickException(
+            'The date layout requires the index (ws_index setting)')
+    print(f'{store.migrate()} alerts moved')
+
+
+@main.command('compact')
+@click.option(
+    '--older-than',
+    type=float,
+    default=settings.ws_compact_after or 30.0,
+    help='Compact the alerts archived for more than this many days',
+)
+@click.pass_obj
+def archive_compact(store: AlertStore, older_than: float):
+    '''
+    Roll the older archived alerts into compressed segments.
+
+    The alerts remain available to list and fetch.
+    '''
+    print(f'{store.compact(older_than)} alerts compacted')
@@ -0,0 +1,124 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from typing import Any, Dict, Optional
+
+import logging
+
+import click
+
+from gunicorn.app.base import BaseApplication
+
+from pyravealert.config import get_app_settings, LogLevels
+
+
+settings = get_app_settings()
+
+
+class WSApplication(BaseApplication):
+    '''
+    Gunicorn application serving the CAP receiver
+
+    Each worker process builds its own flask application after the fork.
+    '''
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from pyravealert.ws import create_app
+        return create_app()
+
+
+@click.command()
+@click.option(
+    '--host',
+    default=settings.ws_host,
+    help='Listening address',
+)
+@click.option(
+    '--port',
+    type=int,
+    default=settings.ws_port,
+    help='Listening port',
+)
+@click.option(
+    '--workers',
+    type=int,
+    help='Number of worker processes (ws_workers setting by default, '
+    'a single one with ws_async)',
+)
+@click.option(
+    '--threads',
+    type=int,
+    default=settings.ws_threads,
+    help='Number of threads per worker',
+)
+@click.option(
+    '--backlog',
+    type=int,
+    default=settings.ws_backlog,
+    help='Maximum number of pending connections',
+)
+@click.option(
+    '--graceful-timeout',
+    type=int,
+    default=settings.ws_graceful_timeout,
+    help='Seconds to finish in-flight requests on shutdown',
+)
+@click.option(
+    '--log-level',
+    type=click.Choice([v.value for v in LogLevels]),
+    help='Verbosity'
+)
+def main(
+    host: str,
+    port: int,
+    workers: Optional[int],
+    threads: int,
+    backlog: int,
+    graceful_timeout: int,
+    log_level: str,
+):
+    '''
+    Run the CAP receiver web service.
+
+    Alerts are accepted by POST on / and stored under the
+    ws_write_directory setting.  SIGTERM stops accepting connections and
+    lets in-flight requests finish within the graceful timeout.
+
+    With the ws_async setting, the outcomes of the queued submissions are
+    kept by the worker process which received them so a single worker
+    process is run.
+    '''
+    if log_level is not None:
+        settings.log_level = LogLevels(log_level)
+    settings.configure_logging()
+
+    if settings.ws_async:
+        if workers is not None and workers > 1:
+            raise click.BadParameter(
+                'a single worker process is supported with ws_async, '
+                'use --threads instead',
+                param_hint='--workers')
+        if workers is None and settings.ws_workers > 1:
+            logging.warning(
+                'Running a single worker process instead of %d with '
+                'ws_async', settings.ws_workers)
+        workers = 1
+    elif workers is None:
+        workers = settings.ws_workers
+
+    WSApplication({
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'backlog': backlog,
+        'graceful_timeout': graceful_timeout,
+        'loglevel': settings.log_level.value.lower(),
+    }).run()
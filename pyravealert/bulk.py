@@ -0,0 +1,133 @@
+'''
+Bulk loading of CAP documents
+=============================
+
+Backfilling or resending many alerts loads them from:
+
+    paths = CAP XML files
+    directories = all the *.xml files of the directory
+    globs = files matching the pattern (** matches subdirectories)
+    - = CAP documents read from stdin, concatenated or NUL separated
+
+Documents are parsed in a process pool as parsing, not sending, is the
+bottleneck once the alerts share a pooled connection.
+
+..  codeauthor:: Charles Blais
+'''
+import glob
+
+import os
+
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
+
+from pyoasiscap.alert import Alert
+
+
+STDIN = '-'
+
+GLOB_CHARACTERS = re.compile(r'[*?[]')
+
+END_OF_ALERT = re.compile(rb'</(?:[\w.-]+:)?alert\s*>')
+
+Source = Tuple[str, Union[str, bytes]]
+
+Loaded = Tuple[str, Optional[Alert], Optional[str]]
+
+
+def is_bulk(paths: Sequence[str]) -> bool:
+    '''
+    Check if the paths designate anything else than a single file
+    '''
+    return len(paths) != 1 or paths[0] == STDIN or \
+        GLOB_CHARACTERS.search(paths[0]) is not None or \
+        os.path.isdir(paths[0])
+
+
+def expand(paths: Sequence[str]) -> List[str]:
+    '''
+    Files designated by the paths, in order, stdin kept as -
+
+    :raises FileNotFoundError: for a path (not a glob) that does not exist
+    '''
+    files = []
+    for path in paths:
+        if path == STDIN:
+            files.append(path)
+        elif GLOB_CHARACTERS.search(path):
+            files.extend(sorted(
+                name for name in glob.glob(path, recursive=True)
+                if os.path.isfile(name)))
+        elif os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.xml'))))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(path)
+    return files
+
+
+def split_documents(data: bytes) -> List[bytes]:
+    '''
+    Split a stream of NUL separated or concatenated CAP documents
+    '''
+    documents = []
+    for chunk in data.split(b'\0'):
+        start = 0
+        for match in END_OF_ALERT.finditer(chunk):
+            documents.append(chunk[start:match.end()])
+            start = match.end()
+        documents.append(chunk[start:])
+    return [document.strip() for document in documents if document.strip()]
+
+
+def sources(paths: Sequence[str], stdin: BinaryIO) -> List[Source]:
+    '''
+    Name and path (or content for stdin) of each document
+    '''
+    items: List[Source] = []
+    for path in expand(paths):
+        if path != STDIN:
+            items.append((path, path))
+            continue
+        for index, document in enumerate(split_documents(stdin.read())):
+            items.append((f'<stdin>#{index + 1}', document))
+    return items
+
+
+def _load(source: Source) -> Loaded:
+    from pyoasiscap.cap import from_file, from_string
+
+    name, origin = source
+    try:
+        if isinstance(origin, bytes):
+            return (name, from_string(origin), None)
+        return (name, from_file(origin), None)
+    except Exception as err:
+        return (name, None, str(err) or type(err).__name__)
+
+
+def load(
+    paths: Sequence[str],
+    stdin: BinaryIO,
+    jobs: Optional[int] = None,
+) -> Iterator[Loaded]:
+    '''
+    Parse the documents
+
+    :param jobs: number of parsing processes, the number of CPUs by
+        default.  Documents are parsed in this process with a single job.
+    :returns: name, alert and error for each document, in order.  The
+        alert is None when the document could not be parsed.
+    '''
+    items = sources(paths, stdin)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(items) < 2:
+        yield from map(_load, items)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(
+            _load, items, chunksize=max(1, len(items) // (jobs * 4)))
@@ -0,0 +1,445 @@
+'''
+Client of the inbound CAP listener
+==================================
+
+Delivery of CAP alerts to the Rave inbound CAP listener.  The names are
+also available from :mod:`pyravealert.inbound`, which imports this module
+on first use only so generating alerts does not load the HTTP stack.
+
+..  codeauthor:: Charles Blais
+'''
+import logging
+
+import random
+
+from typing import Optional, List, Iterable, Dict, Any, TYPE_CHECKING
+
+import time
+
+from functools import lru_cache
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import BaseModel
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from requests.auth import HTTPBasicAuth
+
+from urllib3.exceptions import NewConnectionError
+
+from pyoasiscap.cap import to_string
+
+from pyoasiscap.alert import Alert
+
+from pyravealert.config import get_app_settings
+
+from pyravealert.dedup import DedupIndex
+
+from pyravealert.logs import log_payload, log_event
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class SendResult(BaseModel):
+    '''
+    Outcome of a single alert delivery
+    '''
+    identifier: str
+    status_code: Optional[int] = None
+    latency: float = 0.0
+    error: Optional[str] = None
+    duplicate: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _not_sent(err: requests.RequestException) -> bool:
+    '''
+    Check if the request failed before it was sent to the listener
+    '''
+    if isinstance(err, requests.ConnectTimeout):
+        return True
+    reason = getattr(err.args[0], 'reason', None) if err.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class InboundClient:
+    '''
+    Sender for the inbound CAP listener
+
+    The client owns a pooled :class:`requests.Session` so consecutive
+    alerts reuse the same keep-alive connection instead of paying a new
+    TCP/TLS handshake per message.  Basic auth is set once on the session.
+
+    Server errors (5xx) and failures to connect are retried up to
+    `retries` times with jittered exponential backoff.  Errors once the
+    alert may have reached the listener (read timeout, connection lost)
+    are not retried as the listener rejects a duplicate identifier.  No
+    attempt or backoff extends past `deadline` seconds from the start of
+    the send.
+
+    With a `dedup` index, identifiers already delivered are not sent again.
+    '''
+    def __init__(
+        self,
+        url: str,
+        username: str,
+        password: str,
+        pool_size: int = 10,
+        keep_alive: bool = True,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 10.0,
+        deadline: float = 60.0,
+        dedup: Optional[DedupIndex] = None,
+    ):
+        self.url = url
+        self.dedup = dedup
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, password)
+        self.session.headers.update({
+            'Content-Type': 'application/xml'
+        })
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, alert: Alert) -> Optional[requests.Response]:
+        '''
+        Send CAP alert message to inbound CAP listener
+
+        :returns: None if the identifier was already delivered
+        '''
+        if self.is_delivered(alert.identifier):
+            return None
+        data = to_string(alert)
+        log_payload('Sending CAP to Rave', data)
+        return self.post(data, alert.identifier)
+
+    def is_delivered(self, identifier: str) -> bool:
+        '''
+        Check the dedup index for the identifier
+        '''
+        if self.dedup is None or identifier not in self.dedup:
+            return False
+        logging.info('%s already delivered, skipping', identifier)
+        return True
+
+    def post(
+        self,
+        data: str,
+        identifier: Optional[str] = None,
+    ) -> Optional[requests.Response]:
+        '''
+        Post serialized CAP XML, retrying within the deadline
+
+        :param identifier: identifier of the alert for the dedup index
+        :returns: None if the identifier was already delivered
+        :raises requests.RequestException: last error once the retries
+            or the deadline are exhausted
+        '''
+        if identifier is not None and self.is_delivered(identifier):
+            return None
+        start = time.monotonic()
+        req = self._post(data)
+        log_event(
+            'Sent CAP to Rave', str(identifier), len(data),
+            time.monotonic() - start)
+        if identifier is not None and self.dedup is not None:
+            self.dedup.add(identifier)
+        return req
+
+    def _post(self, data: str) -> requests.Response:
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            remaining = self.deadline - (time.monotonic() - start)
+            try:
+                req = self.session.post(
+                    self.url,
+                    data=data,
+                    timeout=(
+                        min(self.connect_timeout, remaining),
+                        min(self.read_timeout, remaining),
+                    )
+                )
+                req.raise_for_status()
+                return req
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if not _not_sent(err):
+                    raise
+                error: requests.RequestException = err
+            except requests.HTTPError as err:
+                if err.response is None or err.response.status_code < 500:
+                    raise
+                error = err
+
+            delay = self._backoff(attempt)
+            remaining = self.deadline - (time.monotonic() - start)
+            if attempt >= self.retries or delay >= remaining:
+                raise error
+            attempt += 1
+            logging.warning(
+                'Attempt %d failed (%s), retrying in %.2fs',
+                attempt, error, delay)
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        '''
+        Full-jitter exponential backoff delay for the given attempt
+        '''
+        return random.uniform(0, min(
+            self.backoff_max, self.backoff_factor * 2 ** attempt))
+
+    def send_many(
+        self,
+        alerts: Iterable[Alert],
+        concurrency: int = 4,
+    ) -> List[SendResult]:
+        '''
+        Send multiple CAP alert messages in parallel
+
+        Alerts are serialized and posted over a pool of at most
+        `concurrency` threads sharing this client's connection pool.
+        Failures do not interrupt the batch; the results are returned
+        in input order.
+
+        .. note:: concurrency should not exceed the pool size or extra
+            connections are opened and discarded after each request
+        '''
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(self._send_result, alerts))
+
+    def _send_result(self, alert: Alert) -> SendResult:
+        '''
+        Send an alert and record its outcome instead of raising
+        '''
+        result = SendResult(identifier=alert.identifier)
+        start = time.monotonic()
+        try:
+            req = self.send(alert)
+            if req is None:
+                result.duplicate = True
+            else:
+                result.status_code = req.status_code
+        except requests.HTTPError as err:
+            if err.response is not None:
+                result.status_code = err.response.status_code
+            result.error = str(err)
+        except Exception as err:
+            logging.error('Failed to send %s: %s', alert.identifier, err)
+            result.error = str(err)
+        result.latency = time.monotonic() - start
+        return result
+
+    def close(self):
+        '''
+        Close all pooled connections
+        '''
+        self.session.close()
+
+    def __enter__(self) -> 'InboundClient':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncInboundClient:
+    '''
+    Asyncio sender for the inbound CAP listener
+
+    Counterpart of :class:`InboundClient` built on :mod:`httpx` (install
+    the ``async`` extra).  Connections are pooled and kept alive, every
+    request is bounded by a timeout and at most `concurrency` requests are
+    in flight at once.
+    '''
+    def __init__(
+        self,
+        url: str,
+        username: str,
+        password: str,
+        pool_size: int = 10,
+        timeout: float = 10.0,
+        concurrency: int = 4,
+    ):
+        import httpx
+
+        self.url = url
+        self.concurrency = concurrency
+        self.client = httpx.AsyncClient(
+            auth=(username, password),
+            headers={'Content-Type': 'application/xml'},
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+            timeout=timeout,
+        )
+        self._semaphore: Optional['asyncio.Semaphore'] = None
+
+    @property
+    def semaphore(self) -> 'asyncio.Semaphore':
+        import asyncio
+
+        # Created on first use so it is bound to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def send(
+        self,
+        alert: Alert,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        '''
+        Send CAP alert message to inbound CAP listener
+
+        :param timeout: override the client timeout for this request
+        '''
+        data = to_string(alert)
+        log_payload('Sending CAP to Rave', data)
+
+        kwargs: Dict[str, Any] = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        start = time.monotonic()
+        async with self.semaphore:
+            req = await self.client.post(self.url, content=data, **kwargs)
+        req.raise_for_status()
+        log_event(
+            'Sent CAP to Rave', alert.identifier, len(data),
+            time.monotonic() - start)
+        return req
+
+    async def send_many(
+        self,
+        alerts: Iterable[Alert],
+    ) -> List[SendResult]:
+        '''
+        Send multiple CAP alert messages concurrently
+
+        See :meth:`InboundClient.send_many`
+        '''
+        import asyncio
+
+        return list(await asyncio.gather(*[
+            self._send_result(alert) for alert in alerts
+        ]))
+
+    async def _send_result(self, alert: Alert) -> SendResult:
+        '''
+        Send an alert and record its outcome instead of raising
+        '''
+        import httpx
+
+        result = SendResult(identifier=alert.identifier)
+        start = time.monotonic()
+        try:
+            result.status_code = (await self.send(alert)).status_code
+        except httpx.HTTPStatusError as err:
+            result.status_code = err.response.status_code
+            result.error = str(err)
+        except Exception as err:
+            logging.error('Failed to send %s: %s', alert.identifier, err)
+            result.error = str(err)
+        result.latency = time.monotonic() - start
+        return result
+
+    async def aclose(self):
+        '''
+        Close all pooled connections
+        '''
+        await self.client.aclose()
+
+    async def __aenter__(self) -> 'AsyncInboundClient':
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+
+@lru_cache()
+def _dedup_index() -> Optional[DedupIndex]:
+    '''
+    Process-wide dedup index shared by the clients
+    '''
+    settings = get_app_settings()
+    if settings.dedup_size > 0 or settings.dedup_path is not None:
+        return DedupIndex(settings.dedup_size, settings.dedup_path)
+    return None
+
+
+@lru_cache()
+def get_inbound_client(
+    url: str,
+    username: str,
+    password: str,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> InboundClient:
+    '''
+    Process-wide client per listener, credentials and timeouts
+
+    The timeouts, retries and deadline default to the settings.
+    '''
+    settings = get_app_settings()
+    return InboundClient(
+        url,
+        username,
+        password,
+        pool_size=settings.pool_size,
+        keep_alive=settings.keep_alive,
+        connect_timeout=settings.connect_timeout
+        if connect_timeout is None else connect_timeout,
+        read_timeout=settings.read_timeout
+        if read_timeout is None else read_timeout,
+        retries=settings.retries if retries is None else retries,
+        backoff_factor=settings.backoff_factor,
+        backoff_max=settings.backoff_max,
+        deadline=settings.deadline if deadline is None else deadline,
+        dedup=_dedup_index(),
+    )
+
+
+def send(alert: Alert, url: str, username: str, password: str):
+    '''
+    Send CAP alert message to inbound CAP listener
+
+    Thin wrapper over the shared :func:`get_inbound_client` instance.
+    '''
+    get_inbound_client(url, username, password).send(alert)
+
+
+def send_many(
+    alerts: Iterable[Alert],
+    url: str,
+    username: str,
+    password: str,
+    concurrency: int = 4,
+) -> List[SendResult]:
+    '''
+    Send multiple CAP alert messages to inbound CAP listener
+
+    See :meth:`InboundClient.send_many`
+    '''
+    return get_inbound_client(url, username, password).send_many(
+        alerts, concurrency=concurrency)
@@ -3,6 +3,8 @@
 '''
 import logging
 
+import os
+
 from typing import Optional, Dict
 
 from enum import Enum
@@ -13,6 +15,8 @@ from pydantic import BaseSettings
 
 import tempfile
 
+from pyravealert import logs
+
 
 class LogLevels(Enum):
     DEBUG: str = 'DEBUG'
@@ -21,19 +25,84 @@ class LogLevels(Enum):
     ERROR: str = 'ERROR'
 
 
+class FsyncPolicy(Enum):
+    NONE: str = 'none'
+    FILE: str = 'file'
+    FILE_DIR: str = 'file+dir'
+
+
+class ArchiveLayout(Enum):
+    FLAT: str = 'flat'
+    DATE: str = 'date'
+    HASH: str = 'hash'
+
+
+class IdentifierStrategy(Enum):
+    LEGACY: str = 'legacy'
+    SORTABLE: str = 'sortable'
+
+
+def _default_socket() -> str:
+    directory = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+    return os.path.join(
+        directory, f'ravealert-{getattr(os, "getuid", lambda: 0)()}.sock')
+
+
 class AppSettings(BaseSettings):
     log_level: LogLevels = LogLevels.WARNING
     log_format: str = '%(asctime)s.%(msecs)03d %(levelname)s \
 %(module)s %(funcName)s: %(message)s'
     log_datefmt: str = '%Y-%m-%d %H:%M:%S'
+    log_structured: bool = False
+    log_payload_file: Optional[str] = None
+    log_payload_rate: float = 10.0
+    ws_log_queue: bool = True
 
     url: str = 'http://localhost'
     username: Optional[str] = None
     password: Optional[str] = None
+    pool_size: int = 10
+    keep_alive: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    retries: int = 3
+    backoff_factor: float = 0.5
+    backoff_max: float = 10.0
+    deadline: float = 60.0
+    send_concurrency: int = 4
+    identifier: IdentifierStrategy = IdentifierStrategy.SORTABLE
+    dedup_size: int = 10000
+    dedup_path: Optional[str] = None
+
+    daemon_socket: str = _default_socket()
+    daemon_forward: bool = True
+
+    outbox: Optional[str] = None
+    outbox_batch: int = 500
+    outbox_concurrency: int = 4
+    outbox_interval: float = 30.0
+    outbox_lease: float = 300.0
 
+    ws_host: str = '0.0.0.0'
     ws_port: int = 3000
+    ws_workers: int = 2
+    ws_threads: int = 4
+    ws_backlog: int = 2048
+    ws_graceful_timeout: int = 30
     ws_write_directory: str = tempfile.gettempdir()
     ws_basic_auth: Dict[str, str] = {}
+    ws_auth_cache_ttl: float = 60.0
+    ws_fsync: FsyncPolicy = FsyncPolicy.NONE
+    ws_index: bool = True
+    ws_rules_file: Optional[str] = None
+    ws_archive_layout: ArchiveLayout = ArchiveLayout.FLAT
+    ws_compact_after: Optional[float] = None
+    ws_compact_interval: float = 3600.0
+    ws_max_content_length: int = 1024 * 1024
+    ws_async: bool = False
+    ws_queue_size: int = 100
+    ws_queue_workers: int = 2
+    ws_retry_after: int = 5
 
     class Config:
         env_file = '.env'
@@ -53,6 +122,14 @@ class AppSettings(BaseSettings):
             format=self.log_format,
             datefmt=self.log_datefmt,
             level=level)
+        logs.configure(
+            structured=self.log_structured,
+            enabled=(
+                level == logging.DEBUG or self.log_payload_file is not None),
+            rate=self.log_payload_rate,
+            filename=self.log_payload_file,
+            formatter=logging.Formatter(self.log_format, self.log_datefmt),
+        )
 
 
 @lru_cache()
@@ -0,0 +1,143 @@
+'''
+Local ravealert daemon
+======================
+
+Every ravealert invocation pays for the interpreter startup, the imports
+and a new connection to the inbound CAP listener before a single POST.
+The daemon (``ravealert serve``) listens on a Unix domain socket and keeps
+the connection pool warm: ravealert forwards its alert to the daemon when
+one is running and sends it itself otherwise.
+
+Each connection carries one JSON request, ended by the client shutting
+down its writes, answered by one JSON response.  The socket is only
+accessible to the user running the daemon.
+
+..  codeauthor:: Charles Blais
+'''
+import json
+
+import logging
+
+import os
+
+import socket
+
+import socketserver
+
+import stat
+
+from typing import Any, Callable, Dict, Optional
+
+
+Handler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.read())
+            response = self.server.handler(request)  # type: ignore
+        except Exception as err:
+            logging.exception('Daemon request failed')
+            response = {'error': str(err)}
+        self.wfile.write(json.dumps(response).encode())
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Unix domain socket server handling each request in a thread
+
+    :param path: socket file, replaced if left over by a dead daemon
+    :param handler: process the request, returns the response.  Exceptions
+        are returned as an error response.
+    :raises RuntimeError: when a daemon is already listening on the path
+    '''
+    daemon_threads = True
+
+    def __init__(self, path: str, handler: Handler):
+        self.path = path
+        self.handler = handler
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise RuntimeError(f'{path} is not a socket')
+            sock = _connect(path, 1.0)
+            if sock is not None:
+                sock.close()
+                raise RuntimeError(f'A daemon is already running on {path}')
+            os.unlink(path)
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _connect(path: str, timeout: float) -> Optional[socket.socket]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def connect(path: str, timeout: float) -> Optional[socket.socket]:
+    '''
+    Connect to the daemon
+
+    :param timeout: seconds to wait for the response on the connection
+    :returns: connection, None if no daemon is running
+    '''
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        logging.warning('Ignoring %s, not a socket of this user', path)
+        return None
+    return _connect(path, timeout)
+
+
+def exchange(sock: socket.socket, request: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Send the request on the connection and read the response
+
+    Errors are raised rather than reported as no daemon so the caller
+    does not send the alert a second time.
+    '''
+    with sock:
+        sock.sendall(json.dumps(request).encode())
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
+
+
+def forward(
+    path: str,
+    request: Dict[str, Any],
+    timeout: float,
+) -> Optional[Dict[str, Any]]:
+    '''
+    Send the request to the daemon
+
+    :param timeout: seconds to wait for the response
+    :returns: response of the daemon, None if no daemon is running
+    '''
+    sock = connect(path, timeout)
+    return None if sock is None else exchange(sock, request)
@@ -0,0 +1,81 @@
+'''
+Index of delivered CAP identifiers
+==================================
+
+The inbound CAP listener requires identifiers to be unique.  The index
+remembers the identifiers already delivered so retries and multiple
+producers do not send the same alert twice.  Recent identifiers are kept
+in a bounded LRU in memory, optionally backed by a SQLite database so the
+index survives restarts and is shared between processes.
+
+..  codeauthor:: Charles Blais
+'''
+import sqlite3
+
+import threading
+
+import time
+
+from typing import Optional, OrderedDict
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS delivered (
+    identifier TEXT PRIMARY KEY,
+    delivered REAL NOT NULL
+)
+'''
+
+
+class DedupIndex:
+    '''
+    Delivered identifiers
+
+    :param size: number of identifiers kept in memory
+    :param path: optional SQLite database file keeping every identifier
+    '''
+    def __init__(self, size: int = 10000, path: Optional[str] = None):
+        self.size = size
+        self._recent: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(SCHEMA)
+
+    def __contains__(self, identifier: str) -> bool:
+        with self._lock:
+            if identifier in self._recent:
+                self._recent.move_to_end(identifier)
+                return True
+            if self.connection is None:
+                return False
+            found = self.connection.execute(
+                'SELECT 1 FROM delivered WHERE identifier = ?',
+                (identifier,)).fetchone() is not None
+            if found:
+                self._remember(identifier)
+            return found
+
+    def add(self, identifier: str):
+        '''
+        Record the identifier as delivered
+        '''
+        with self._lock:
+            self._remember(identifier)
+            if self.connection is not None:
+                with self.connection:
+                    self.connection.execute(
+                        'INSERT OR IGNORE INTO delivered VALUES (?, ?)',
+                        (identifier, time.time()))
+
+    def _remember(self, identifier: str):
+        self._recent[identifier] = None
+        self._recent.move_to_end(identifier)
+        while len(self._recent) > self.size:
+            self._recent.popitem(last=False)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
@@ -0,0 +1,115 @@
+'''
+CAP identifier generators
+=========================
+
+Identifiers must be unique per inbound CAP listener.  The following
+strategies are available (see the identifier setting):
+
+    legacy = hostname-timestamp-random, the historical format
+    sortable = hostname-time-process-sequence, unique across threads and
+        processes of a host and sortable by creation time
+
+The hostname is resolved once per process.
+
+..  codeauthor:: Charles Blais
+'''
+import abc
+
+import datetime
+
+import os
+
+import secrets
+
+import socket
+
+import string
+
+import threading
+
+import time
+
+from functools import lru_cache
+
+from typing import Dict, Type
+
+from pyravealert.config import get_app_settings, IdentifierStrategy
+
+
+@lru_cache()
+def get_hostname() -> str:
+    return socket.gethostname()
+
+
+class IdentifierGenerator(abc.ABC):
+    '''
+    Base class of the identifier strategies
+    '''
+    @abc.abstractmethod
+    def __call__(self) -> str:
+        '''
+        New identifier
+        '''
+
+
+class LegacyIdentifier(IdentifierGenerator):
+    '''
+    hostname-timestamp-random identifier
+    '''
+    def __call__(self) -> str:
+        suffix = ''.join(
+            secrets.choice(string.ascii_lowercase) for _ in range(5))
+        return f'{get_hostname()}-\
+{datetime.datetime.utcnow().timestamp()}-{suffix}'
+
+
+class SortableIdentifier(IdentifierGenerator):
+    '''
+    Snowflake style hostname-time-process-sequence identifier
+
+    The time is in milliseconds since the epoch and the sequence counts
+    identifiers generated within the same millisecond.  When the sequence
+    overflows or the clock goes back, the time component keeps moving
+    forward from the last identifier so identifiers stay unique and
+    ordered.  All components are fixed width hexadecimal.
+    '''
+    SEQUENCE_MAX = 0xffff
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._last = 0
+        self._sequence = 0
+
+    def __call__(self) -> str:
+        now = time.time_ns() // 1000000
+        with self._lock:
+            if now > self._last:
+                self._last = now
+                self._sequence = 0
+            elif self._sequence < self.SEQUENCE_MAX:
+                self._sequence += 1
+            else:
+                self._last += 1
+                self._sequence = 0
+            last, sequence = self._last, self._sequence
+        return f'{get_hostname()}-{last:012x}-{self._pid:06x}-{sequence:04x}'
+
+
+STRATEGIES: Dict[IdentifierStrategy, Type[IdentifierGenerator]] = {
+    IdentifierStrategy.LEGACY: LegacyIdentifier,
+    IdentifierStrategy.SORTABLE: SortableIdentifier,
+}
+
+
+@lru_cache()
+def get_identifier_generator() -> IdentifierGenerator:
+    '''
+    Process-wide generator of the configured strategy
+    '''
+    return STRATEGIES[get_app_settings().identifier]()
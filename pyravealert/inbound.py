@@ -32,21 +32,11 @@ twitter = event, headline
 '''
 import logging
 
-import random
-
-import string
-
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Tuple
 
 import datetime
 
-import socket
-
-import requests
-
-from requests.auth import HTTPBasicAuth
-
-from pyoasiscap.cap import to_string
+import uuid
 
 from pyoasiscap.alert import Alert, Status, MsgType, Scope
 
@@ -56,6 +46,12 @@ from pyoasiscap.info import Info, Category, \
 
 from pyoasiscap.geocode import GeoCode
 
+from pyravealert.identifier import get_identifier_generator, get_hostname
+
+
+def _sent() -> str:
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
 
 def generate(
     status: Status = Status.test,
@@ -87,9 +83,7 @@ def generate(
     .. note:: This quick method only support Alert msgType
     '''
     if identifier is None:
-        identifier = f'{socket.gethostname()}-\
-{datetime.datetime.utcnow().timestamp()}-\
-{"".join(random.choice(string.ascii_lowercase) for i in range(5))}'
+        identifier = get_identifier_generator()()
 
     area = [Area(areaDesc=areaDesc, geocode=geocode)] \
         if areaDesc is not None else None
@@ -102,8 +96,8 @@ def generate(
         code=code,
         incidents=incidents,
         # Required but not used
-        sender=socket.gethostname(),
-        sent=datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        sender=get_hostname(),
+        sent=_sent(),
         info=[Info(
             category=category,
             event=event,
@@ -125,19 +119,162 @@ def generate(
     )
 
 
-def send(alert: Alert, url: str, username: str, password: str):
+class AlertTemplate:
     '''
-    Send CAP alert message to inbound CAP listener
+    Precompiled alert stamping out variants of the same message
+
+    The constant fields are validated once when the template is built,
+    with the same arguments as :func:`generate`.  Each :meth:`stamp` only
+    fills the per-message fields in a shallow copy of the template, so the
+    lists shared with the template (category, code, parameter...) must be
+    treated as read-only.
+
+    :meth:`render` goes further and returns the serialized XML directly.
+    The template is serialized once with placeholders in the per-message
+    fields and each message only escapes and splices its values in that
+    skeleton.  The skeleton is checked against :func:`to_string` when it
+    is built; if the output differs, render falls back to the full
+    serialization.
     '''
-    data = to_string(alert)
-    logging.info(f'Sending CAP to Rave:\n{data}')
-
-    req = requests.post(
-        url,
-        data=data,
-        headers={
-            'Content-Type': 'application/xml'
-        },
-        auth=HTTPBasicAuth(username, password)
-    )
-    req.raise_for_status()
+    FIELDS = ('identifier', 'sent', 'headline', 'description')
+    # Sample values checked to render like to_string, including the
+    # characters that need escaping
+    SAMPLE = '<Sample> & "quoted" \'text\' é'
+
+    def __init__(self, **kwargs: Any):
+        kwargs.setdefault('identifier', 'template')
+        self.prototype = generate(**kwargs)
+        self._skeletons: Dict[Tuple[bool, bool], Optional[List[str]]] = {}
+
+    def stamp(
+        self,
+        identifier: Optional[str] = None,
+        sent: Optional[str] = None,
+        headline: Optional[str] = None,
+        description: Optional[str] = None,
+        **info: Any,
+    ) -> Alert:
+        '''
+        New alert from the template
+
+        :param identifier: generated when not set
+        :param sent: now when not set
+        :param headline: the template headline when not set
+        :param description: the template description when not set
+        :param info: other Info fields to replace, as validated values
+            (for example area=[Area(...)])
+        '''
+        if headline is not None:
+            info['headline'] = headline
+        if description is not None:
+            info['description'] = description
+        return self.prototype.copy(update={
+            'identifier': identifier or get_identifier_generator()(),
+            'sent': sent or _sent(),
+            'info': [self.prototype.info[0].copy(update=info)],
+        })
+
+    def render(
+        self,
+        identifier: Optional[str] = None,
+        sent: Optional[str] = None,
+        headline: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        '''
+        Serialized alert from the template
+
+        Same as ``to_string(stamp(...))`` without building the alert.  Post
+        the result with :meth:`InboundClient.post`.
+
+        :returns: identifier and CAP XML of the alert
+        '''
+        from xml.sax.saxutils import escape
+
+        from pyoasiscap.cap import to_string
+
+        info = self.prototype.info[0]
+        values = {
+            'identifier': identifier or get_identifier_generator()(),
+            'sent': sent or _sent(),
+            'headline': info.headline if headline is None else headline,
+            'description':
+                info.description if description is None else description,
+        }
+        skeleton = self._skeleton(
+            values['headline'] is not None,
+            values['description'] is not None)
+        if skeleton is None:
+            return values['identifier'], to_string(self.stamp(**values))
+        parts = skeleton[:]
+        # Odd parts are the names of the fields between the literal XML
+        for i in range(1, len(parts), 2):
+            parts[i] = escape(values[parts[i]])
+        return values['identifier'], ''.join(parts)
+
+    def _skeleton(
+        self,
+        headline: bool,
+        description: bool,
+    ) -> Optional[List[str]]:
+        '''
+        XML split around the per-message fields, None if not supported
+        '''
+        from xml.sax.saxutils import escape
+
+        from pyoasiscap.cap import to_string
+
+        key = (headline, description)
+        if key in self._skeletons:
+            return self._skeletons[key]
+
+        optional = {'headline': headline, 'description': description}
+        present = [name for name in self.FIELDS if optional.get(name, True)]
+        tokens = {f'pyravealert{uuid.uuid4().hex}': name for name in present}
+        xml = to_string(self.stamp(**{
+            name: token for token, name in tokens.items()}))
+
+        skeleton = self._split(xml, tokens)
+        if skeleton is not None:
+            sample = {name: f'{self.SAMPLE} {name}' for name in present}
+            rendered = ''.join(
+                escape(sample[part]) if i % 2 else part
+                for i, part in enumerate(skeleton))
+            if rendered != to_string(self.stamp(**sample)):
+                skeleton = None
+        if skeleton is None:
+            logging.warning('Template can not be pre-serialized')
+        self._skeletons[key] = skeleton
+        return skeleton
+
+    @staticmethod
+    def _split(xml: str, tokens: Dict[str, str]) -> Optional[List[str]]:
+        '''
+        Split the XML around each token (in order), replaced by its name
+        '''
+        parts = [xml]
+        for token, name in tokens.items():
+            head, found, tail = parts[-1].partition(token)
+            if not found or token in tail:
+                return None
+            parts[-1:] = [head, name, tail]
+        return parts
+
+
+# The client names are resolved on first use so generating alerts does not
+# import the HTTP stack (see pyravealert.client)
+CLIENT = (
+    'SendResult',
+    'InboundClient',
+    'AsyncInboundClient',
+    'get_inbound_client',
+    'send',
+    'send_many',
+)
+
+
+def __getattr__(name: str) -> Any:
+    if name in CLIENT:
+        from pyravealert import client
+        return getattr(client, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,227 @@
+'''
+Index of the archived CAP alerts
+================================
+
+Finding alerts in the archive by walking its directories and parsing
+every file does not scale to hundreds of thousands of alerts.  The
+:class:`pyravealert.storage.AlertStore` records each alert it writes in a
+SQLite sidecar database keyed on:
+
+    identifier, status = the archived alert
+    sent = sent time, also as a timestamp for range queries
+    event, sender = of the alert (event of its first info)
+    category = categories of all its infos
+
+The path of the archived file (relative to the store) is kept so an
+alert is fetched without guessing its status.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+
+import sqlite3
+
+import threading
+
+from pathlib import Path
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pyoasiscap.alert import Alert
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS alerts (
+    identifier TEXT NOT NULL,
+    status TEXT NOT NULL COLLATE NOCASE,
+    sender TEXT,
+    sent TEXT,
+    sent_ts REAL,
+    msg_type TEXT,
+    event TEXT COLLATE NOCASE,
+    path TEXT NOT NULL,
+    PRIMARY KEY (identifier, status)
+);
+CREATE INDEX IF NOT EXISTS alerts_sent ON alerts (sent_ts);
+CREATE INDEX IF NOT EXISTS alerts_status ON alerts (status, sent_ts);
+CREATE INDEX IF NOT EXISTS alerts_event ON alerts (event, sent_ts);
+CREATE INDEX IF NOT EXISTS alerts_sender ON alerts (sender, sent_ts);
+CREATE TABLE IF NOT EXISTS categories (
+    category TEXT NOT NULL COLLATE NOCASE,
+    identifier TEXT NOT NULL,
+    status TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (category, identifier, status)
+) WITHOUT ROWID;
+'''
+
+COLUMNS = 'identifier, status, sender, sent, msg_type, event, path, ' \
+    '(SELECT group_concat(category) FROM categories c ' \
+    'WHERE c.identifier = a.identifier AND c.status = a.status) AS category'
+
+
+def _value(value: Any) -> Any:
+    return getattr(value, 'value', value)
+
+
+def timestamp(value: Union[str, datetime.datetime, None]) -> Optional[float]:
+    '''
+    POSIX timestamp of an ISO 8601 time, UTC if it has no time zone
+
+    :raises ValueError: when the time can not be parsed
+    '''
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        text = str(value)
+        if text.endswith('Z'):
+            text = text[:-1] + '+00:00'
+        value = datetime.datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+class ArchiveIndex:
+    '''
+    SQLite index of the archived alerts
+
+    :param path: SQLite database file
+    '''
+    def __init__(self, path: Union[str, Path]):
+        self.path = path
+        self._lock = threading.Lock()
+        # several web service processes write to the same index
+        self.connection = sqlite3.connect(
+            str(path), timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def add(self, alert: Alert, path: str):
+        '''
+        Record the archived alert
+
+        :param path: path of the archived file relative to the store
+        '''
+        self.add_many([(alert, path)])
+
+    def add_many(self, alerts: List[Tuple[Alert, str]]):
+        '''
+        Record archived alerts in a single transaction
+        '''
+        rows = []
+        categories: List[Tuple[str, str, str]] = []
+        for alert, path in alerts:
+            status = str(_value(alert.status))
+            try:
+                sent_ts = timestamp(alert.sent)
+            except ValueError:
+                sent_ts = None
+            rows.append((
+                alert.identifier, status, alert.sender, str(alert.sent),
+                sent_ts, str(_value(alert.msgType)),
+                alert.info[0].event if alert.info else None, path))
+            categories.extend({
+                (str(_value(category)), alert.identifier, status)
+                for info in alert.info for category in info.category
+            })
+        with self._lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO alerts '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO categories VALUES (?, ?, ?)',
+                categories)
+
+    def get(
+        self,
+        identifier: str,
+        status: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        '''
+        Indexed alert, the last one sent if stored under several statuses
+        '''
+        query = f'SELECT {COLUMNS} FROM alerts a WHERE identifier = ?'
+        args: Tuple = (identifier,)
+        if status is not None:
+            query += ' AND status = ?'
+            args += (status,)
+        with self._lock:
+            row = self.connection.execute(
+                query + ' ORDER BY sent_ts DESC LIMIT 1', args).fetchone()
+        return None if row is None else self._to_dict(row)
+
+    def relocate(self, moves: List[Tuple[str, str, str]]):
+        '''
+        Record the new paths of moved alerts
+
+        :param moves: path, identifier and status of each alert
+        '''
+        with self._lock, self.connection:
+            self.connection.executemany(
+                'UPDATE alerts SET path = ? '
+                'WHERE identifier = ? AND status = ?', moves)
+
+    def search(
+        self,
+        status: Optional[str] = None,
+        event: Optional[str] = None,
+        category: Optional[str] = None,
+        sender: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        '''
+        Indexed alerts matching all the criteria, last sent first
+
+        Text criteria are case insensitive.
+
+        :param since: ISO 8601 time, alerts sent at or after
+        :param until: ISO 8601 time, alerts sent before
+        :raises ValueError: when since or until can not be parsed
+        '''
+        clauses = []
+        args: List[Any] = []
+        for column, value in (
+            ('status', status), ('event', event), ('sender', sender),
+        ):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                args.append(value)
+        if category is not None:
+            clauses.append(
+                'EXISTS (SELECT 1 FROM categories c WHERE c.category = ? '
+                'AND c.identifier = a.identifier AND c.status = a.status)')
+            args.append(category)
+        if since is not None:
+            clauses.append('sent_ts >= ?')
+            args.append(timestamp(since))
+        if until is not None:
+            clauses.append('sent_ts < ?')
+            args.append(timestamp(until))
+        query = f'SELECT {COLUMNS} FROM alerts a'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY sent_ts DESC LIMIT ?'
+        with self._lock:
+            rows = self.connection.execute(query, args + [limit]).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        result = dict(row)
+        result['category'] = sorted(
+            result['category'].split(',') if result['category'] else [])
+        return result
+
+    def clear(self):
+        '''
+        Remove all entries
+        '''
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM alerts')
+            self.connection.execute('DELETE FROM categories')
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,142 @@
+'''
+Logging of CAP payloads
+=======================
+
+By default full CAP payloads are logged at INFO.  In structured mode (the
+log_structured setting), INFO only gets one line per alert with its
+identifier, size and latency while the full payloads go at DEBUG to the
+separate ``pyravealert.payload`` logger.  That logger writes to its own
+handler (log_payload_file or stderr) through a rate limit so a burst of
+alerts can not flood it.  It is only enabled with the DEBUG log level or
+a log_payload_file.
+
+Messages are formatted lazily: nothing is formatted for disabled levels.
+Long-running services can also move the handlers behind a queue
+(:func:`start_queue_listener`) so slow console or disk I/O never blocks
+the threads logging.
+
+..  codeauthor:: Charles Blais
+'''
+import logging
+
+import queue
+
+import threading
+
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+
+from typing import Any, Optional
+
+
+payload_logger = logging.getLogger('pyravealert.payload')
+
+_structured = False
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Token bucket letting through at most `rate` records per second
+
+    The number of records dropped since the last one let through is
+    prefixed to its message.  The bucket holds at least one record so
+    rates below one record per second let one through now and then.
+    '''
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1
+            suppressed, self._suppressed = self._suppressed, 0
+        if suppressed:
+            record.msg = f'({suppressed} payloads suppressed) {record.msg}'
+        return True
+
+
+def configure(
+    structured: bool,
+    enabled: bool,
+    rate: float,
+    filename: Optional[str],
+    formatter: logging.Formatter,
+):
+    '''
+    Configure the payload logger (once per process)
+
+    :param structured: use the structured mode
+    :param enabled: enable the payload logger
+    :param rate: maximum payloads logged per second
+    :param filename: payload log file, stderr by default
+    '''
+    global _structured
+    _structured = structured
+    payload_logger.setLevel(logging.DEBUG if enabled else logging.WARNING)
+    if payload_logger.handlers:
+        return
+    handler: logging.Handler = logging.StreamHandler() \
+        if filename is None else logging.FileHandler(filename)
+    handler.setFormatter(formatter)
+    handler.addFilter(RateLimitFilter(rate))
+    payload_logger.addHandler(handler)
+    payload_logger.propagate = False
+
+
+def start_queue_listener(
+    logger: logging.Logger,
+) -> Optional[QueueListener]:
+    '''
+    Move the handlers of the logger behind a queue
+
+    The records are queued by the logging threads and handled by a
+    listener thread.  Stop the listener to flush the queue.
+
+    :returns: started listener, None if already started
+    '''
+    if any(isinstance(h, QueueHandler) for h in logger.handlers):
+        return None
+    records: queue.Queue = queue.Queue()
+    listener = QueueListener(
+        records, *logger.handlers, respect_handler_level=True)
+    logger.handlers = [QueueHandler(records)]
+    listener.start()
+    return listener
+
+
+def log_payload(message: str, payload: Any):
+    '''
+    Log the full payload (formatted only if enabled)
+    '''
+    if _structured:
+        payload_logger.debug('%s:\n%s', message, payload)
+    else:
+        logging.info('%s:\n%s', message, payload)
+
+
+def log_event(
+    message: str,
+    identifier: str,
+    size: int,
+    latency: float,
+):
+    '''
+    Log the summary of an alert in structured mode
+    '''
+    if _structured:
+        logging.info(
+            '%s identifier=%s size=%d latency=%.3f',
+            message, identifier, size, latency)
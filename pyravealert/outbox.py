@@ -0,0 +1,285 @@
+'''
+Outbox of CAP alerts
+====================
+
+Alerts are journaled in a SQLite database before being delivered so they
+survive delivery failures and process restarts.  Each entry holds the
+serialized CAP XML and its delivery state:
+
+    pending = waiting for (another) delivery attempt
+    in_flight = claimed by a drain until its lease expires
+    delivered = accepted by the inbound CAP listener
+    failed = rejected by the listener (4xx), replay to try again
+
+Entries are drained in batches, posting a batch in parallel over the
+shared connection pool of an :class:`pyravealert.inbound.InboundClient`.
+Several processes can drain the same outbox: a batch is claimed in the
+transaction selecting it so an entry is only posted by one of them.  The
+entries of a drain that died are claimed again once their lease expires.
+
+..  codeauthor:: Charles Blais
+'''
+import logging
+
+import sqlite3
+
+import threading
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    identifier TEXT NOT NULL,
+    data TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    last_error TEXT,
+    lease REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, id);
+'''
+
+# id, new state (None when not posted) and error of a delivered entry
+Outcome = Tuple[int, Optional[str], Optional[str]]
+
+
+class Outbox:
+    '''
+    Persistent queue of CAP alerts to deliver
+
+    :param path: SQLite database file
+    :param batch: number of entries delivered per batch
+    :param lease: seconds a drain has to deliver the entries it claimed,
+        more than the deadline of the client
+    '''
+    def __init__(self, path: str, batch: int = 500, lease: float = 300.0):
+        self.path = path
+        self.batch = batch
+        self.lease = lease
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # WAL with full sync keeps every committed entry across crashes
+        # without blocking readers during a drain
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.executescript(SCHEMA)
+        columns = [
+            row['name'] for row in
+            self.connection.execute('PRAGMA table_info(outbox)')]
+        if 'lease' not in columns:
+            with self.connection:
+                self.connection.execute(
+                    'ALTER TABLE outbox ADD COLUMN lease REAL')
+
+    def put(self, identifier: str, data: str) -> int:
+        '''
+        Journal the serialized alert
+
+        :returns: id of the entry
+        '''
+        now = time.time()
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO outbox (identifier, data, created, updated) '
+                'VALUES (?, ?, ?, ?)',
+                (identifier, data, now, now))
+        return cursor.lastrowid or 0
+
+    def list(
+        self,
+        state: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        '''
+        Entries (without their data) ordered by id
+        '''
+        query = 'SELECT id, identifier, state, attempts, created, ' \
+            'updated, last_error FROM outbox'
+        args: Tuple = ()
+        if state is not None:
+            query += ' WHERE state = ?'
+            args = (state,)
+        query += ' ORDER BY id LIMIT ?'
+        with self._lock:
+            rows = self.connection.execute(query, args + (limit,))
+            return [dict(row) for row in rows]
+
+    def replay(self, ids: Optional[Sequence[int]] = None) -> int:
+        '''
+        Mark entries pending again
+
+        :param ids: entries to deliver again whatever their state,
+            all failed entries by default
+        :returns: number of entries to deliver again
+        '''
+        if ids is None:
+            query = 'UPDATE outbox SET state = ?, attempts = 0, ' \
+                'updated = ? WHERE state = ?'
+            args: Tuple = (PENDING, time.time(), FAILED)
+        else:
+            query = 'UPDATE outbox SET state = ?, attempts = 0, ' \
+                f'updated = ? WHERE id IN ({",".join("?" * len(ids))})'
+            args = (PENDING, time.time()) + tuple(ids)
+        with self._lock, self.connection:
+            return self.connection.execute(query, args).rowcount
+
+    def _claim(
+        self,
+        after: int,
+        ids: Optional[Sequence[int]],
+    ) -> List[sqlite3.Row]:
+        '''
+        Select the next batch and mark it in flight in one transaction
+        '''
+        now = time.time()
+        query = 'SELECT id, identifier, data FROM outbox ' \
+            'WHERE (state = ? OR (state = ? AND lease < ?)) AND id > ?'
+        args: Tuple = (PENDING, IN_FLIGHT, now, after)
+        if ids is not None:
+            query += f' AND id IN ({",".join("?" * len(ids))})'
+            args += tuple(ids)
+        query += ' ORDER BY id LIMIT ?'
+        with self._lock, self.connection:
+            # the write lock is taken before the select so another
+            # process can not claim the same entries
+            self.connection.execute('BEGIN IMMEDIATE')
+            rows = self.connection.execute(
+                query, args + (self.batch,)).fetchall()
+            self.connection.executemany(
+                'UPDATE outbox SET state = ?, lease = ? WHERE id = ?',
+                [(IN_FLIGHT, now + self.lease, row['id']) for row in rows])
+        return rows
+
+    def drain(
+        self,
+        client: Any,
+        concurrency: int = 4,
+        ids: Optional[Sequence[int]] = None,
+    ) -> Dict[str, int]:
+        '''
+        Deliver the pending entries once each
+
+        Draining stops at the first connection error or timeout, or when
+        a whole batch fails, as the listener is most likely unreachable.
+        The entries not posted yet are left pending.
+
+        :param client: :class:`pyravealert.inbound.InboundClient`
+        :param ids: restrict to those entries
+        :returns: number of entries delivered, failed and left pending
+        '''
+        counts = {DELIVERED: 0, FAILED: 0, PENDING: 0}
+        after = 0
+        unreachable = threading.Event()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while not unreachable.is_set():
+                rows = self._claim(after, ids)
+                if not rows:
+                    break
+                after = rows[-1]['id']
+                outcomes = list(executor.map(
+                    lambda row: self._deliver(client, row, unreachable),
+                    rows))
+                self._record(outcomes)
+                for _, state, _ in outcomes:
+                    counts[state or PENDING] += 1
+                if all(state != DELIVERED for _, state, _ in outcomes):
+                    break
+        logging.info('Outbox drained: %s', counts)
+        return counts
+
+    def _deliver(
+        self,
+        client: Any,
+        row: sqlite3.Row,
+        unreachable: threading.Event,
+    ) -> Outcome:
+        '''
+        Post the entry and return its new state
+
+        Entries whose identifier the client already delivered are marked
+        delivered without being posted again.  Once the listener is
+        unreachable, entries are not posted and their state is None.
+        '''
+        if unreachable.is_set():
+            return (row['id'], None, None)
+        try:
+            client.post(row['data'], row['identifier'])
+        except requests.HTTPError as err:
+            status_code = 500 if err.response is None \
+                else err.response.status_code
+            logging.warning(
+                'Failed to deliver %s: %s', row['identifier'], err)
+            return (
+                row['id'], FAILED if status_code < 500 else PENDING, str(err))
+        except Exception as err:
+            if isinstance(err, (requests.ConnectionError, requests.Timeout)):
+                unreachable.set()
+            logging.warning(
+                'Failed to deliver %s: %s', row['identifier'], err)
+            return (row['id'], PENDING, str(err))
+        return (row['id'], DELIVERED, None)
+
+    def _record(self, outcomes: List[Outcome]):
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.executemany(
+                'UPDATE outbox SET state = ?, attempts = attempts + 1, '
+                'updated = ?, last_error = ?, lease = NULL WHERE id = ?',
+                [
+                    (state, now, error, id)
+                    for id, state, error in outcomes if state is not None
+                ])
+            self.connection.executemany(
+                'UPDATE outbox SET state = ?, lease = NULL WHERE id = ?',
+                [(PENDING, id) for id, state, _ in outcomes if state is None])
+
+    def close(self):
+        self.connection.close()
+
+
+class Drainer(threading.Thread):
+    '''
+    Background thread draining the outbox periodically
+
+    :param interval: seconds between drains
+    '''
+    def __init__(
+        self,
+        outbox: Outbox,
+        client: Any,
+        interval: float = 30.0,
+        concurrency: int = 4,
+    ):
+        super().__init__(daemon=True)
+        self.outbox = outbox
+        self.client = client
+        self.interval = interval
+        self.concurrency = concurrency
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.outbox.drain(self.client, self.concurrency)
+            except Exception:
+                logging.exception('Outbox drain failed')
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,129 @@
+'''
+Background processing of received CAP alerts
+============================================
+
+The web service can acknowledge a submission as soon as it is queued and
+leave parsing, validation and storage to a pool of worker threads.  The
+outcome of each submission is kept for a while under a tracking id.
+
+.. note:: outcomes are kept in memory by the process which received the
+    submission.  ravealert-ws runs a single worker process (and several
+    threads) with ws_async so status queries reach the same process.
+
+..  codeauthor:: Charles Blais
+'''
+import logging
+
+import queue
+
+import threading
+
+import traceback
+
+import uuid
+
+from typing import Any, Callable, Dict, List, Optional, OrderedDict
+
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    '''The pipeline can not accept more submissions for now'''
+
+
+class Pipeline:
+    '''
+    Bounded queue of submissions processed by worker threads
+
+    :param handler: process the raw payload, returns a message or raises.
+        Exceptions with a status_code and message attribute (like the web
+        service exceptions) are reported as is, others as 500.
+    :param size: maximum number of queued submissions
+    :param workers: number of worker threads
+    :param max_results: number of outcomes kept for status queries
+    '''
+    def __init__(
+        self,
+        handler: Callable[[bytes], str],
+        size: int = 100,
+        workers: int = 2,
+        max_results: int = 10000,
+    ):
+        self.handler = handler
+        self.queue: queue.Queue = queue.Queue(maxsize=size)
+        self.max_results = max_results
+        self.results: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, data: bytes) -> str:
+        '''
+        Queue the payload for processing
+
+        :returns: tracking id
+        :raises QueueFull: when the queue is full
+        '''
+        tracking_id = uuid.uuid4().hex
+        self._record(tracking_id, {'state': PENDING})
+        try:
+            self.queue.put_nowait((tracking_id, data))
+        except queue.Full:
+            with self._lock:
+                del self.results[tracking_id]
+            raise QueueFull()
+        return tracking_id
+
+    def status(self, tracking_id: str) -> Optional[Dict[str, Any]]:
+        '''
+        Outcome of the submission, None if unknown
+        '''
+        with self._lock:
+            return self.results.get(tracking_id)
+
+    def _record(self, tracking_id: str, result: Dict[str, Any]):
+        with self._lock:
+            self.results[tracking_id] = result
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            tracking_id, data = item
+            try:
+                message = self.handler(data)
+                result = {
+                    'state': DONE,
+                    'status_code': 200,
+                    'message': message,
+                }
+            except Exception as err:
+                status_code = getattr(err, 'status_code', 500)
+                if status_code >= 500:
+                    logging.error(traceback.format_exc())
+                result = {
+                    'state': FAILED,
+                    'status_code': status_code,
+                    'message': getattr(err, 'message', str(err)),
+                }
+            self._record(tracking_id, result)
+            self.queue.task_done()
+
+    def close(self, timeout: Optional[float] = None):
+        '''
+        Process the queued submissions and stop the workers
+        '''
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
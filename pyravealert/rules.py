@@ -0,0 +1,372 @@
+'''
+Validation rules of received CAP alerts
+=======================================
+
+The CAP receiver validates alerts against declarative rules, loaded from
+the JSON file of the ws_rules_file setting (a list of rules), or the
+:data:`DEFAULT_RULES` otherwise.  A rule is::
+
+    {
+        "field": "info[0].description",
+        "operator": "not_matches",
+        "value": "^Insert",
+        "message": "English not changed from default",
+        "status": ["Actual"],
+        "category": ["Geo"]
+    }
+
+The field is a dotted path in the alert, lists are indexed with ``[n]``
+or else all their elements are checked.  Operators:
+
+    exists, missing = the field has at least one value, or none
+    equals, not_equals, one_of, matches, not_matches = every value of the
+        field is (not) equal to the value, in the value list, or matches
+        (or not) the regular expression (re.search)
+
+The rule only applies to alerts of the listed statuses and categories
+(all by default).  Text comparisons use the values of the CAP enumerations
+(e.g. Actual, Geo).
+
+Rules are compiled once into a :class:`RuleSet`: field paths are parsed,
+regular expressions compiled and rules bucketed by status so validating
+an alert only runs plain Python closures.
+
+..  codeauthor:: Charles Blais
+'''
+import json
+
+import re
+
+from enum import Enum
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+
+class Operator(Enum):
+    EXISTS: str = 'exists'
+    MISSING: str = 'missing'
+    EQUALS: str = 'equals'
+    NOT_EQUALS: str = 'not_equals'
+    ONE_OF: str = 'one_of'
+    MATCHES: str = 'matches'
+    NOT_MATCHES: str = 'not_matches'
+
+
+class Rule(BaseModel):
+    '''
+    Declarative validation rule
+    '''
+    field: str
+    operator: Operator
+    value: Any = None
+    message: str
+    status: List[str] = []
+    category: List[str] = []
+
+
+class RuleViolation(ValueError):
+    '''The alert does not satisfy a rule'''
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+DEFAULT_RULES = [
+    Rule(
+        field='info',
+        operator=Operator.EXISTS,
+        message='No <info> element in the CAP alert',
+    ),
+    Rule(
+        field='info[0].description',
+        operator=Operator.EXISTS,
+        message='No <description> in the first <info> element',
+    ),
+    Rule(
+        field='info[0].description',
+        operator=Operator.MATCHES,
+        value=r'^(?:(?!---)[\s\S])*---(?:(?!---)[\s\S])*$',
+        message='Must be split by --- characters',
+    ),
+    Rule(
+        field='info[0].description',
+        operator=Operator.NOT_MATCHES,
+        value=r'^Insert',
+        message='English not changed from default',
+    ),
+    Rule(
+        field='info[0].description',
+        operator=Operator.NOT_MATCHES,
+        value=r'^(?:(?!---)[\s\S])*---Insérez',
+        message='French not changed from default',
+    ),
+]
+
+# Operators of the rules checked by the streaming pre-validation of the
+# receiver, per field it reads.  Only the presence of info is known.
+STREAMED_FIELDS = {
+    'info': (Operator.EXISTS, Operator.MISSING),
+    'info[0].description': tuple(Operator),
+}
+
+PATH_STEP = re.compile(r'^(\w+)(?:\[(\d+)\])?$')
+
+GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+Check = Callable[[List[Any]], Optional[str]]
+
+Compiled = Tuple[str, Check, frozenset]
+
+
+def _compile_path(path: str) -> Callable[[Any], List[Any]]:
+    '''
+    Getter of the values of the field path
+    '''
+    steps: List[Tuple[str, Optional[int]]] = []
+    for step in path.split('.'):
+        match = PATH_STEP.match(step)
+        if match is None:
+            raise ValueError(f'Invalid field path {path}')
+        index = match.group(2)
+        steps.append((match.group(1), None if index is None else int(index)))
+
+    def get(alert: Any) -> List[Any]:
+        values = [alert]
+        for name, index in steps:
+            found = []
+            for value in values:
+                value = getattr(value, name, None)
+                if index is not None:
+                    value = value[index] \
+                        if isinstance(value, list) and len(value) > index \
+                        else None
+                if isinstance(value, list):
+                    found.extend(value)
+                elif value is not None:
+                    found.append(value)
+            values = found
+        return [getattr(value, 'value', value) for value in values]
+    return get
+
+
+def compile_rule(rule: Rule) -> Check:
+    '''
+    Check of the values of the rule field, returning the message of the
+    rule if they violate it
+
+    :raises ValueError: for invalid regular expressions
+    '''
+    message = rule.message
+    if rule.operator is Operator.EXISTS:
+        return lambda values: None if values else message
+    if rule.operator is Operator.MISSING:
+        return lambda values: message if values else None
+    if rule.operator in (Operator.MATCHES, Operator.NOT_MATCHES):
+        try:
+            search = re.compile(str(rule.value)).search
+        except re.error as err:
+            raise ValueError(f'Invalid expression {rule.value}: {err}')
+        if rule.operator is Operator.MATCHES:
+            def check(values: List[Any]) -> Optional[str]:
+                for value in values:
+                    if search(str(value)) is None:
+                        return message
+                return None
+        else:
+            def check(values: List[Any]) -> Optional[str]:
+                for value in values:
+                    if search(str(value)) is not None:
+                        return message
+                return None
+        return check
+    if rule.operator is Operator.ONE_OF:
+        allowed = frozenset(rule.value or ())
+        return lambda values: None if allowed.issuperset(values) \
+            else message
+    expected = rule.operator is Operator.EQUALS
+    return lambda values: None if all(
+        (value == rule.value) is expected for value in values) else message
+
+
+def _scoped(pattern: str) -> str:
+    '''
+    Pattern with its leading global flags, e.g. (?i), scoped to it
+    '''
+    match = GLOBAL_FLAGS.match(pattern)
+    if match is None:
+        return f'(?:{pattern})'
+    return f'(?{match.group(1)}:{pattern[match.end():]})'
+
+
+def _screen(entries: List[Tuple[Rule, frozenset]]) -> List[Compiled]:
+    '''
+    Checks detecting whether any of the rules may be violated
+
+    The not_matches rules of a field are merged in a single regular
+    expression and its not_equals rules in a set lookup.  The other rules
+    are checked as they are.
+    '''
+    screens: List[Compiled] = []
+    patterns: Dict[Tuple[str, frozenset], List[str]] = {}
+    forbidden: Dict[Tuple[str, frozenset], set] = {}
+    for rule, categories in entries:
+        key = (rule.field, categories)
+        if rule.operator is Operator.NOT_MATCHES:
+            # numbered backreferences would change meaning once merged
+            if re.compile(str(rule.value)).groups == 0:
+                patterns.setdefault(key, []).append(str(rule.value))
+                continue
+        elif rule.operator is Operator.NOT_EQUALS:
+            try:
+                forbidden.setdefault(key, set()).add(rule.value)
+                continue
+            except TypeError:
+                pass
+        screens.append((rule.field, compile_rule(rule), categories))
+    for (field, categories), group in patterns.items():
+        try:
+            value = '|'.join(_scoped(pattern) for pattern in group)
+            re.compile(value)
+        except re.error:
+            for pattern in group:
+                screens.append((field, compile_rule(Rule(
+                    field=field, operator=Operator.NOT_MATCHES,
+                    value=pattern, message=pattern)), categories))
+            continue
+        screens.append((field, compile_rule(Rule(
+            field=field, operator=Operator.NOT_MATCHES,
+            value=value, message=field)), categories))
+    for (field, categories), values in forbidden.items():
+        screens.append((field, _forbidden(frozenset(values)), categories))
+    return screens
+
+
+def _forbidden(values: frozenset) -> Check:
+    def check(found: List[Any]) -> Optional[str]:
+        for value in found:
+            try:
+                if value in values:
+                    return 'forbidden'
+            except TypeError:
+                return 'unhashable'
+        return None
+    return check
+
+
+class RuleSet:
+    '''
+    Rules compiled for validation
+
+    Most alerts satisfy all the rules so they are first screened with the
+    rules merged per field (see :func:`_screen`), the rules are only
+    checked one by one to report the first one violated.
+
+    :param rules: rules in evaluation order
+    :raises ValueError: for invalid rules
+    '''
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = list(rules)
+        self._getters = {
+            rule.field: _compile_path(rule.field) for rule in self.rules}
+        compiled = [
+            (rule, compile_rule(rule),
+             frozenset(s.lower() for s in rule.status),
+             frozenset(c.lower() for c in rule.category))
+            for rule in self.rules
+        ]
+        statuses = {s for _, _, scope, _ in compiled for s in scope}
+        # rules applying to each status, and to other statuses
+        buckets: Dict[Optional[str], List[Tuple[Rule, Check, frozenset]]] = {
+            status: [
+                (rule, check, categories)
+                for rule, check, scope, categories in compiled
+                if not scope or status in scope
+            ]
+            for status in statuses
+        }
+        buckets[None] = [
+            (rule, check, categories)
+            for rule, check, scope, categories in compiled
+            if not scope
+        ]
+        self._by_status: Dict[Optional[str], Tuple[
+            List[Compiled], List[Compiled]]] = {
+            status: (
+                _screen([(rule, c) for rule, _, c in bucket]),
+                [(rule.field, check, c) for rule, check, c in bucket],
+            )
+            for status, bucket in buckets.items()
+        }
+        self._categorized = any(c for _, _, _, c in compiled)
+        self._streamed = [
+            (rule.field, check)
+            for rule, check, scope, categories in compiled
+            if rule.operator in STREAMED_FIELDS.get(rule.field, ())
+            and not scope and not categories
+        ]
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'RuleSet':
+        '''
+        Rules of the JSON file, the default rules without file
+        '''
+        if path is None:
+            return cls(DEFAULT_RULES)
+        with open(path) as fp:
+            return cls([Rule(**rule) for rule in json.load(fp)])
+
+    def validate(self, alert: Any):
+        '''
+        :raises RuleViolation: with the message of the first rule violated
+        '''
+        status = str(getattr(alert.status, 'value', alert.status)).lower()
+        screens, checks = self._by_status.get(
+            status, self._by_status[None])
+        categories: frozenset = frozenset()
+        if self._categorized:
+            categories = frozenset(
+                str(getattr(c, 'value', c)).lower()
+                for info in alert.info for c in info.category)
+        # each field is read once whatever the number of rules on it
+        values: Dict[str, List[Any]] = {}
+        for rules in (screens, checks):
+            for field, check, scope in rules:
+                if scope and not scope & categories:
+                    continue
+                try:
+                    found = values[field]
+                except KeyError:
+                    found = values[field] = self._getters[field](alert)
+                message = check(found)
+                if message is None:
+                    continue
+                if rules is checks:
+                    raise RuleViolation(message)
+                # find the first rule violated
+                break
+            else:
+                return
+
+    def validate_streamed(self, has_info: bool, description: Optional[str]):
+        '''
+        Validate the fields read by the streaming pre-validation
+
+        Only the rules on those fields (see :data:`STREAMED_FIELDS`) which
+        apply to all alerts are checked.
+
+        :param has_info: the alert has an <info> element
+        :param description: description of the first <info> element
+        :raises RuleViolation: with the message of the first rule violated
+        '''
+        values: Dict[str, List[Any]] = {
+            'info': [None] if has_info else [],
+            'info[0].description':
+                [description] if has_info and description is not None
+                else [],
+        }
+        for field, check in self._streamed:
+            message = check(values[field])
+            if message is not None:
+                raise RuleViolation(message)
@@ -0,0 +1,233 @@
+'''
+Compressed archive segments
+===========================
+
+Archived alerts older than a few days are rarely read.  The compactor
+rolls them into one compressed segment per status and run::
+
+    <directory>/<status>/segments/<name>.seg
+    <directory>/<status>/segments/<name>.idx
+
+CAP alerts are small and very repetitive (namespaces, codes, instructions,
+contacts) so compressing each one alone gains little.  Every alert is
+instead compressed with zlib against a preset dictionary built from the
+most common lines of the alerts of the segment, stored at the start of
+the segment.  Alerts remain separate zlib streams: the ``.idx`` offset
+index (identifier, offset and length per line) lets a single alert be
+read back without decompressing the rest of the segment.  The name of
+every complete segment is then appended to ``<directory>/<status>/segments/
+.catalog`` whose size tells readers that segments were added.
+
+..  codeauthor:: Charles Blais
+'''
+import collections
+
+import logging
+
+import os
+
+import struct
+
+import threading
+
+import time
+
+import zlib
+
+from pathlib import Path
+
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+
+SEGMENT = '.seg'
+OFFSETS = '.idx'
+CATALOG = '.catalog'
+DICTIONARY_SIZE = 32 * 1024
+HEADER = struct.Struct('>I')
+
+
+def train_dictionary(
+    samples: Sequence[bytes],
+    size: int = DICTIONARY_SIZE,
+) -> bytes:
+    '''
+    Preset dictionary of the lines common to the samples
+
+    zlib favours the end of the dictionary so the most common lines are
+    placed last.
+    '''
+    counts = collections.Counter(
+        line.strip() for sample in samples for line in set(
+            sample.splitlines()))
+    lines = [line for line, count in counts.most_common() if count > 1]
+    dictionary = b''
+    for line in lines:
+        if len(dictionary) + len(line) + 1 > size:
+            break
+        dictionary = line + b'\n' + dictionary
+    return dictionary
+
+
+def write_segment(
+    path: Path,
+    alerts: Sequence[Tuple[str, bytes]],
+    fsync: bool = False,
+) -> List[Tuple[str, int, int]]:
+    '''
+    Write the alerts and the offset index of a new segment
+
+    Both files are written under temporary names and renamed in place, the
+    offset index last, so a segment is only visible once complete.
+
+    :param alerts: identifier and content of each alert
+    :returns: identifier, offset and length of each alert
+    '''
+    dictionary = train_dictionary([content for _, content in alerts])
+    offsets = []
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'wb') as fp:
+        fp.write(HEADER.pack(len(dictionary)))
+        fp.write(dictionary)
+        offset = fp.tell()
+        for identifier, content in alerts:
+            compressor = zlib.compressobj(9, zdict=dictionary)
+            data = compressor.compress(content) + compressor.flush()
+            fp.write(data)
+            offsets.append((identifier, offset, len(data)))
+            offset += len(data)
+        if fsync:
+            fp.flush()
+            os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+    index = path.with_suffix(OFFSETS)
+    tmp = index.with_name(f'.{index.name}.tmp')
+    with open(tmp, 'w') as fp:
+        for identifier, offset, length in offsets:
+            fp.write(f'{identifier}\t{offset}\t{length}\n')
+        if fsync:
+            fp.flush()
+            os.fsync(fp.fileno())
+    os.replace(tmp, index)
+
+    with open(path.with_name(CATALOG), 'a') as fp:
+        fp.write(f'{path.name}\n')
+    return offsets
+
+
+def read_alert(path: Path, offset: int, length: int) -> bytes:
+    '''
+    Decompress a single alert of the segment
+    '''
+    with open(path, 'rb') as fp:
+        size, = HEADER.unpack(fp.read(HEADER.size))
+        dictionary = fp.read(size)
+        fp.seek(offset)
+        data = fp.read(length)
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+class SegmentCatalog:
+    '''
+    Location of the compacted alerts of a status directory
+
+    The offset indexes are loaded in memory.  A lookup only checks the
+    size of the catalog file, which grows with every segment added, and
+    the offset indexes of the new segments are loaded when it changed.
+    '''
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._size: Optional[int] = -1
+        self._loaded: Set[str] = set()
+        self._alerts: Dict[str, Tuple[Path, int, int]] = {}
+
+    def _refresh(self):
+        try:
+            size: Optional[int] = \
+                self.directory.joinpath(CATALOG).stat().st_size
+        except FileNotFoundError:
+            # segments written before the catalog file are listed once
+            size = None
+        if size == self._size:
+            return
+        try:
+            names = sorted(
+                name for name in os.listdir(self.directory)
+                if name.endswith(OFFSETS) and not name.startswith('.') and
+                name not in self._loaded)
+        except FileNotFoundError:
+            return
+        for name in names:
+            index = self.directory.joinpath(name)
+            segment = index.with_suffix(SEGMENT)
+            with open(index) as fp:
+                for line in fp:
+                    identifier, offset, length = line.rstrip('\n').split('\t')
+                    self._alerts[identifier] = (
+                        segment, int(offset), int(length))
+            self._loaded.add(name)
+        self._size = size
+
+    def locate(self, identifier: str) -> Optional[Tuple[Path, int, int]]:
+        '''
+        Segment, offset and length of the alert, None if not compacted
+        '''
+        with self._lock:
+            self._refresh()
+            return self._alerts.get(identifier)
+
+    def identifiers(self) -> List[str]:
+        '''
+        Identifiers of the compacted alerts
+        '''
+        with self._lock:
+            self._refresh()
+            return list(self._alerts)
+
+    def read(self, identifier: str) -> Optional[bytes]:
+        '''
+        Content of the compacted alert, None if not compacted
+        '''
+        location = self.locate(identifier)
+        return None if location is None else read_alert(*location)
+
+
+class Compactor(threading.Thread):
+    '''
+    Background thread compacting the archive periodically
+
+    Only one process compacts the store at a time (see
+    :meth:`pyravealert.storage.AlertStore.compact`).
+
+    :param store: :class:`pyravealert.storage.AlertStore`
+    :param older_than: compact the alerts archived for this many days
+    :param interval: seconds between compactions
+    '''
+    def __init__(
+        self,
+        store: Any,
+        older_than: float,
+        interval: float = 3600.0,
+    ):
+        super().__init__(daemon=True)
+        self.store = store
+        self.older_than = older_than
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                start = time.monotonic()
+                count = self.store.compact(self.older_than)
+                if count:
+                    logging.info(
+                        'Compacted %d alerts in %.1fs',
+                        count, time.monotonic() - start)
+            except Exception:
+                logging.exception('Archive compaction failed')
+
+    def stop(self):
+        self._stop_event.set()
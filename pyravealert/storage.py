@@ -0,0 +1,469 @@
+'''
+Received CAP storage
+====================
+
+Alerts received by the web service are stored per status::
+
+    <directory>/<status>/archive/<shard>/<identifier>.xml
+    <directory>/<status>/current.xml
+
+The :class:`ArchiveLayout` chooses the shard directories so the archive
+never grows into one huge directory:
+
+- flat: no shard, the historical layout
+- date: ``YYYY/MM/DD`` of the sent time (UTC), ``undated`` if unparsable
+- hash: ``ab/cd`` from the SHA-1 of the identifier
+
+The path of an alert follows from its status, identifier and, for the
+date layout, sent time.  An identifier resubmitted with another sent time
+would get another path so the date layout requires the index, which
+lookups by identifier go through.  :meth:`AlertStore.migrate` moves an
+archive written with another layout.
+
+Every alert is written once to the append-only archive.  The latest alert
+of a status is then published by atomically swapping ``current.xml`` to a
+hard link of the archived file, so an upload costs the same number of
+system calls no matter how many alerts are already stored and concurrent
+uploads never move each other's files.
+
+Files are written to a temporary file in the same directory and renamed
+into place so readers never see a partially written alert.  The
+:class:`FsyncPolicy` chooses how much is flushed to disk before the rename:
+
+- none: rely on the operating system (fastest)
+- file: fsync the file content
+- file+dir: also fsync the directory so the rename survives a crash
+
+With an index (see :mod:`pyravealert.index`), every alert written is also
+recorded in ``<directory>/index.sqlite`` so the archive can be searched
+without reading it.
+
+:meth:`AlertStore.compact` rolls old archived alerts into compressed
+segments (see :mod:`pyravealert.segments`) which remain readable one
+alert at a time.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+
+import functools
+
+import hashlib
+
+import logging
+
+import os
+
+import shutil
+
+import tempfile
+
+import threading
+
+import time
+
+from pathlib import Path
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from pyoasiscap.alert import Alert
+
+from pyravealert.config import ArchiveLayout, FsyncPolicy
+
+from pyravealert.index import ArchiveIndex, timestamp
+
+from pyravealert.segments import SEGMENT, SegmentCatalog, write_segment
+
+
+CURRENT = 'current.xml'
+INDEX = 'index.sqlite'
+SEGMENTS = 'segments'
+COMPACT_LOCK = '.compact.lock'
+
+
+class AlertStore:
+    '''
+    Storage of the received CAP alerts
+
+    :param directory: root directory of the store
+    :param fsync: durability policy of the writes
+    :param index: maintain the index of the archive
+    :param layout: shard directories of the archive
+    :raises ValueError: for the date layout without index
+    '''
+    def __init__(
+        self,
+        directory: str,
+        fsync: FsyncPolicy = FsyncPolicy.NONE,
+        index: bool = False,
+        layout: ArchiveLayout = ArchiveLayout.FLAT,
+    ):
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self.layout = layout
+        self._created: Set[Path] = set()
+        self._catalogs: Dict[str, SegmentCatalog] = {}
+        self.index: Optional[ArchiveIndex] = None
+        if layout is ArchiveLayout.DATE and not index:
+            raise ValueError('The date layout requires the index')
+        if index:
+            self._mkdir(self.directory)
+            self.index = ArchiveIndex(self.directory.joinpath(INDEX))
+
+    def status_directory(self, status: str) -> Path:
+        return self.directory.joinpath(status.lower())
+
+    def archive_path(
+        self,
+        status: str,
+        identifier: str,
+        sent: Any = None,
+    ) -> Path:
+        '''
+        Path of the archived alert
+
+        :param sent: sent time of the alert, for the date layout
+        '''
+        archive = self.status_directory(status).joinpath('archive')
+        if self.layout is ArchiveLayout.DATE:
+            try:
+                seconds = timestamp(sent)
+            except ValueError:
+                seconds = None
+            day = 'undated'
+            if seconds is not None:
+                day = datetime.datetime.fromtimestamp(
+                    seconds, datetime.timezone.utc).strftime('%Y/%m/%d')
+            archive = archive.joinpath(day)
+        elif self.layout is ArchiveLayout.HASH:
+            digest = hashlib.sha1(identifier.encode()).hexdigest()
+            archive = archive.joinpath(digest[:2], digest[2:4])
+        return archive.joinpath(f'{identifier}.xml')
+
+    def exists(self, status: str, identifier: str, sent: Any = None) -> bool:
+        '''
+        Check if the alert was already stored, without listing the archive
+
+        With an index, the identifier is looked up in the index, and the
+        archive for the alerts stored before the index with the flat and
+        hash layouts.  Otherwise the archive then the segments are checked.
+
+        :param sent: sent time of the alert, for the date layout
+        '''
+        if self.index is not None:
+            if self.index.get(identifier, status) is not None:
+                return True
+            # the date path depends on the sent time, which can differ
+            return self.layout is not ArchiveLayout.DATE and \
+                self.archive_path(status, identifier).exists()
+        return self.archive_path(status, identifier, sent).exists() or \
+            self._catalog(status).locate(identifier) is not None
+
+    def _catalog(self, status: str) -> SegmentCatalog:
+        directory = self.status_directory(status)
+        if directory.name not in self._catalogs:
+            self._catalogs[directory.name] = SegmentCatalog(
+                directory.joinpath(SEGMENTS))
+        return self._catalogs[directory.name]
+
+    def current_path(self, status: str) -> Path:
+        '''
+        Path of the latest alert of the status
+        '''
+        return self.status_directory(status).joinpath(CURRENT)
+
+    def _mkdir(self, directory: Path):
+        if directory not in self._created:
+            directory.mkdir(mode=0o755, parents=True, exist_ok=True)
+            self._created.add(directory)
+
+    def write(
+        self,
+        status: str,
+        identifier: str,
+        content: bytes,
+        alert: Optional[Alert] = None,
+    ) -> Path:
+        '''
+        Archive the alert and make it the current one of its status
+
+        :param alert: parsed alert, recorded in the index
+        :returns: path of the archived alert
+        '''
+        filename = self.archive_path(
+            status, identifier, None if alert is None else alert.sent)
+        self._mkdir(filename.parent)
+        logging.info('Writing result to %s', filename)
+        self._write_atomic(filename, content)
+
+        self._publish(filename, self.current_path(status))
+        if self.index is not None and alert is not None:
+            self.index.add(
+                alert, str(filename.relative_to(self.directory)))
+        return filename
+
+    def read(self, identifier: str) -> Optional[bytes]:
+        '''
+        Content of the archived alert, None if not found
+
+        The index gives the location of the alert, otherwise the archive
+        (listed with the date layout) and the segments of every status are
+        checked.
+        '''
+        if self.index is not None:
+            entry = self.index.get(identifier)
+            if entry is None:
+                return None
+            if entry['path'].endswith(SEGMENT):
+                return self._catalog(entry['status']).read(identifier)
+            return self.directory.joinpath(entry['path']).read_bytes()
+        for directory in self._status_directories():
+            if self.layout is ArchiveLayout.DATE:
+                for _, filename in self.archived(directory):
+                    if filename.name == f'{identifier}.xml':
+                        return filename.read_bytes()
+            else:
+                filename = self.archive_path(directory.name, identifier)
+                if filename.exists():
+                    return filename.read_bytes()
+            content = self._catalog(directory.name).read(identifier)
+            if content is not None:
+                return content
+        return None
+
+    def _status_directories(self) -> Iterator[Path]:
+        if not self.directory.is_dir():
+            return
+        for directory in sorted(self.directory.iterdir()):
+            if directory.is_dir():
+                yield directory
+
+    def archived(
+        self,
+        directory: Optional[Path] = None,
+    ) -> Iterator[Tuple[str, Path]]:
+        '''
+        Status and path of every archived alert, whatever the layout
+
+        :param directory: only this status directory
+        '''
+        directories = self._status_directories() \
+            if directory is None else iter([directory])
+        for status_directory in directories:
+            archive = status_directory.joinpath('archive')
+            for root, _, names in os.walk(archive):
+                for name in names:
+                    # skip the temporary files of writes in progress
+                    if name.endswith('.xml') and not name.startswith('.'):
+                        yield (status_directory.name, Path(root, name))
+
+    def migrate(self, batch: int = 1000) -> int:
+        '''
+        Move the archived alerts to the layout of the store
+
+        The index, if any, follows the moved files.  The sent time needed
+        by the date layout is taken from the index or the file.
+
+        :returns: number of alerts moved
+        '''
+        from pyoasiscap.cap import from_file
+
+        moved: List[Tuple[str, str, str]] = []
+        count = 0
+        for status, filename in list(self.archived()):
+            identifier = filename.name[:-len('.xml')]
+            sent = None
+            if self.layout is ArchiveLayout.DATE:
+                entry = None if self.index is None \
+                    else self.index.get(identifier, status)
+                try:
+                    sent = entry['sent'] if entry is not None \
+                        else from_file(str(filename)).sent
+                except Exception as err:
+                    logging.warning('No sent time for %s: %s', filename, err)
+            target = self.archive_path(status, identifier, sent)
+            if target == filename:
+                continue
+            self._mkdir(target.parent)
+            os.replace(filename, target)
+            count += 1
+            moved.append((
+                str(target.relative_to(self.directory)), identifier, status))
+            if self.index is not None and len(moved) >= batch:
+                self.index.relocate(moved)
+                moved = []
+        if self.index is not None:
+            self.index.relocate(moved)
+        self._prune()
+        return count
+
+    def _prune(self):
+        '''
+        Remove the empty shard directories
+        '''
+        for directory in self._status_directories():
+            archive = directory.joinpath('archive')
+            for root, _, files in os.walk(archive, topdown=False):
+                if root == str(archive) or files:
+                    continue
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    # not empty, it still holds shard directories
+                    pass
+        self._created.clear()
+
+    def reindex(self, batch: int = 1000) -> int:
+        '''
+        Rebuild the index from the archived files and segments
+
+        :returns: number of alerts indexed
+        '''
+        from pyoasiscap.cap import from_string
+
+        if self.index is None:
+            raise ValueError('The store has no index')
+        self.index.clear()
+        count = 0
+        pending = []
+        for path, read in self._stored():
+            try:
+                alert = from_string(read())
+            except Exception as err:
+                logging.warning('Not indexing %s: %s', path, err)
+                continue
+            pending.append((alert, str(path.relative_to(self.directory))))
+            if len(pending) >= batch:
+                self.index.add_many(pending)
+                count += len(pending)
+                pending = []
+        self.index.add_many(pending)
+        return count + len(pending)
+
+    def _stored(
+        self,
+    ) -> Iterator[Tuple[Path, Callable[[], Optional[bytes]]]]:
+        '''
+        Path and reader of every stored alert, archived or compacted
+        '''
+        for _, filename in self.archived():
+            yield (filename, filename.read_bytes)
+        for directory in self._status_directories():
+            catalog = self._catalog(directory.name)
+            for identifier in catalog.identifiers():
+                location = catalog.locate(identifier)
+                if location is not None:
+                    yield (location[0], functools.partial(
+                        catalog.read, identifier))
+
+    def compact(self, older_than: float, segment_size: int = 10000) -> int:
+        '''
+        Roll the alerts archived more than `older_than` days ago into
+        compressed segments
+
+        Only one process compacts the store at a time, the others return
+        right away.
+
+        :param segment_size: maximum number of alerts per segment
+        :returns: number of alerts compacted
+        '''
+        import fcntl
+
+        cutoff = time.time() - older_than * 86400
+        self._mkdir(self.directory)
+        with open(self.directory.joinpath(COMPACT_LOCK), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            count = 0
+            for directory in self._status_directories():
+                old = [
+                    filename for _, filename in self.archived(directory)
+                    if filename.stat().st_mtime < cutoff
+                ]
+                for start in range(0, len(old), segment_size):
+                    self._compact(directory, old[start:start + segment_size])
+                    count += len(old[start:start + segment_size])
+        if count:
+            self._prune()
+        return count
+
+    def _compact(self, directory: Path, filenames: List[Path]):
+        '''
+        Write the files to a new segment then remove them
+        '''
+        segments = directory.joinpath(SEGMENTS)
+        self._mkdir(segments)
+        name = datetime.datetime.now(datetime.timezone.utc).strftime(
+            '%Y%m%dT%H%M%S%f')
+        segment = segments.joinpath(f'{name}{SEGMENT}')
+        offsets = write_segment(
+            segment,
+            [(f.name[:-len('.xml')], f.read_bytes()) for f in filenames],
+            fsync=self.fsync is not FsyncPolicy.NONE)
+        self._fsync_directory(segments)
+        logging.info('Compacted %d alerts to %s', len(offsets), segment)
+        if self.index is not None:
+            path = str(segment.relative_to(self.directory))
+            self.index.relocate([
+                (path, identifier, directory.name)
+                for identifier, _, _ in offsets
+            ])
+        # current.xml is another link to the latest alert and stays
+        for filename in filenames:
+            os.unlink(filename)
+
+    def _write_atomic(self, filename: Path, content: bytes):
+        '''
+        Write content to a temporary file and rename it to filename
+        '''
+        fd, tmp = tempfile.mkstemp(
+            dir=filename.parent, prefix=f'.{filename.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(content)
+                if self.fsync is not FsyncPolicy.NONE:
+                    fp.flush()
+                    os.fsync(fp.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._fsync_directory(filename.parent)
+
+    def _fsync_directory(self, directory: Path):
+        '''
+        Flush directory entries to disk under the file+dir policy
+        '''
+        if self.fsync is not FsyncPolicy.FILE_DIR:
+            return
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _publish(self, filename: Path, current: Path):
+        '''
+        Atomically replace current with the content of filename
+        '''
+        tmp = current.with_name(
+            f'.{current.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            os.link(filename, tmp)
+        except FileExistsError:
+            os.unlink(tmp)
+            os.link(filename, tmp)
+        except OSError:
+            # File systems without hard links get a copy instead
+            shutil.copyfile(filename, tmp)
+        os.replace(tmp, current)
+        self._fsync_directory(current.parent)
+        # rename() is a no-op when both names already link the same file
+        # (the same identifier received twice), leaving tmp behind
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
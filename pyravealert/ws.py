@@ -0,0 +1,380 @@
+"""
+CAP receiver web service
+========================
+
+Flask application accepting CAP alerts by POST and storing them through
+:class:`pyravealert.storage.AlertStore`.  In production it is served by the
+``ravealert-ws`` command (see :mod:`pyravealert.bin.ravealert_ws`).  For
+development it can be started with::
+
+    flask --app pyravealert.ws run
+
+With the ws_async setting, submissions are only checked to be well-formed
+XML before being queued (see :mod:`pyravealert.pipeline`).  The response is
+then a 202 with a tracking id whose outcome is available at
+``/status/<tracking id>``.  A 503 with a Retry-After header is returned
+while the queue is full.
+
+With the ws_index setting, the stored alerts are searched with
+``/alerts`` (status, event, category, sender, since, until and limit query
+parameters) and fetched with ``/alerts/<identifier>``.
+
+With the ws_compact_after setting (days), a background thread compacts
+the older archived alerts into compressed segments every
+ws_compact_interval seconds (see :mod:`pyravealert.segments`).
+
+..  codeauthor:: Charles Blais
+"""
+import os
+
+import logging
+
+import atexit
+
+import time
+
+from xml.etree import ElementTree
+
+from xml.parsers import expat
+
+from typing import Optional, Dict, Iterator, Tuple, Union, cast
+
+# Third-party library
+from flask import Flask, Response, jsonify, request
+
+from flask_httpauth import HTTPBasicAuth
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# User-contributed library
+from pyravealert.config import get_app_settings, LogLevels
+
+from pyravealert.auth import CredentialStore
+
+from pyravealert.storage import AlertStore
+
+from pyravealert.pipeline import Pipeline, QueueFull
+
+from pyravealert.rules import RuleSet, RuleViolation
+
+from pyravealert.segments import Compactor
+
+from pyravealert import logs
+
+from pyravealert.logs import log_payload, log_event
+
+from pyoasiscap.cap import from_string, Alert
+
+import traceback
+
+
+settings = get_app_settings()
+
+if os.getenv('FLASK_ENV') == 'development':
+    settings.log_level = LogLevels.DEBUG
+if os.getenv('FLASK_RUN_PORT'):
+    settings.ws_port = int(os.environ['FLASK_RUN_PORT'])
+
+
+PREVALIDATE_CHUNK = 8192
+
+
+class GeneralException(Exception):
+    status_code = 500
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        payload: Optional[Dict] = None
+    ):
+        Exception.__init__(self)
+        self.message = message
+        if status_code is not None:
+            self.status_code = status_code
+        self.payload = payload
+
+    def to_dict(self):
+        rv = dict(self.payload or ())
+        rv['status_code'] = self.status_code
+        rv['message'] = self.message
+        return rv
+
+
+class InvalidUsage(GeneralException):
+    """Invalid usage exception"""
+    status_code = 400
+
+
+class ServiceUnavailable(GeneralException):
+    """Service temporarily unavailable exception"""
+    status_code = 503
+
+
+def _set_flask_logging():
+    """
+    Set the logging stream
+
+    Called once per process.  With ws_log_queue, the handlers are moved
+    behind a queue so request threads never wait on log I/O.
+    """
+    settings = get_app_settings()
+    settings.configure_logging()
+    if not settings.ws_log_queue:
+        return
+    for logger in (logging.getLogger(), logs.payload_logger):
+        listener = logs.start_queue_listener(logger)
+        if listener is not None:
+            atexit.register(listener.stop)
+
+
+def _parse_cap(data: bytes) -> Alert:
+    """
+    Parse the CAP alert directly from the request body
+
+    The XML parser decodes the content itself so no decoded copy of the
+    body is made.  Legacy submissions that are not valid UTF-8 are decoded
+    as ISO-8859-2 instead.
+    """
+    try:
+        return from_string(data)
+    except Exception:
+        try:
+            data.decode('utf-8')
+        except UnicodeDecodeError:
+            return from_string(data.decode('iso-8859-2'))
+        raise
+
+
+def _first_description(data: Union[bytes, str]) -> Tuple[bool, Optional[str]]:
+    """
+    Read the description of the first <info> element incrementally
+
+    Parsing stops at the end of the first <info> element.
+
+    :returns: if an <info> element was found and its description
+    :raises ElementTree.ParseError: when the XML is malformed
+    """
+    parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(
+        events=('end',))
+    for start in range(0, len(data), PREVALIDATE_CHUNK):
+        parser.feed(data[start:start + PREVALIDATE_CHUNK])
+        events = cast(
+            Iterator[Tuple[str, ElementTree.Element]], parser.read_events())
+        for _, element in events:
+            if element.tag.rpartition('}')[2] == 'info':
+                for child in element:
+                    if child.tag.rpartition('}')[2] == 'description':
+                        return (True, child.text)
+                return (True, None)
+    parser.close()
+    return (False, None)
+
+
+def _prevalidate_cap(data: bytes, rules: RuleSet):
+    """
+    Reject submissions with an invalid description before the full parse
+
+    Only the beginning of the document, up to the first <info> element, is
+    parsed and checked against the rules on those fields.  Malformed
+    documents are left to the full parse to report.
+    """
+    try:
+        found, description = _first_description(data)
+    except ElementTree.ParseError:
+        try:
+            data.decode('utf-8')
+            return
+        except UnicodeDecodeError:
+            pass
+        try:
+            found, description = _first_description(
+                data.decode('iso-8859-2'))
+        except ElementTree.ParseError:
+            return
+    try:
+        rules.validate_streamed(found, description)
+    except RuleViolation as err:
+        raise InvalidUsage(err.message)
+
+
+def _validate_cap(alert: Alert, rules: RuleSet):
+    """
+    We validate the message before accepting against the rules (see
+    :mod:`pyravealert.rules`, by default the description must be split
+    by --- and the English and French placeholders changed).
+    """
+    try:
+        rules.validate(alert)
+    except RuleViolation as err:
+        raise InvalidUsage(err.message)
+
+
+def create_app():
+    """Create flask API"""
+    # Start the flask API
+    app = Flask(__name__)
+    auth = HTTPBasicAuth()
+
+    settings = get_app_settings()
+    _set_flask_logging()
+    # Larger bodies are rejected with 413 before being read
+    app.config['MAX_CONTENT_LENGTH'] = settings.ws_max_content_length
+    credentials = CredentialStore(
+        settings.ws_basic_auth,
+        ttl=settings.ws_auth_cache_ttl,
+    )
+    # Rules are compiled once, invalid rules fail the startup
+    rules = RuleSet.load(settings.ws_rules_file)
+    store = AlertStore(
+        settings.ws_write_directory,
+        fsync=settings.ws_fsync,
+        index=settings.ws_index,
+        layout=settings.ws_archive_layout,
+    )
+
+    def process(data: bytes) -> str:
+        """Parse, validate and store the CAP alert"""
+        start = time.monotonic()
+        # We attempt to parse to validate the content of the informat
+        try:
+            alert = _parse_cap(data)
+        except Exception as err:
+            logging.error(traceback.format_exc())
+            raise GeneralException(str(err))
+
+        log_payload('Received CAP alert', alert)
+
+        # Re-submissions of a stored identifier are accepted as no-op so
+        # retrying clients succeed without overwriting the archive
+        status = str(alert.status.value)
+        if store.exists(status, alert.identifier, alert.sent):
+            logging.info('%s already stored, skipping', alert.identifier)
+            return f'already uploaded {alert.identifier}'
+
+        # Before accepting the message, we make sure that it satisfies the
+        # validation rules.
+        _validate_cap(alert, rules)
+
+        # We archive the result using the identifier has reference and
+        # make it the current alert of its status
+        store.write(status, alert.identifier, data, alert)
+        log_event(
+            'Stored CAP alert', alert.identifier, len(data),
+            time.monotonic() - start)
+
+        return f'uploaded {alert.identifier}'
+
+    if settings.ws_compact_after is not None:
+        compactor = Compactor(
+            store,
+            older_than=settings.ws_compact_after,
+            interval=settings.ws_compact_interval,
+        )
+        compactor.start()
+        atexit.register(compactor.stop)
+
+    pipeline: Optional[Pipeline] = None
+    if settings.ws_async:
+        pipeline = Pipeline(
+            process,
+            size=settings.ws_queue_size,
+            workers=settings.ws_queue_workers,
+        )
+        atexit.register(pipeline.close, settings.ws_graceful_timeout)
+
+    @auth.verify_password
+    def verify_password(username: str, password: str) -> Optional[str]:
+        if credentials.verify(username, password):
+            return username
+        return None
+
+    @app.route('/', methods=['POST'])
+    @auth.login_required
+    def post_cap():
+        # The body is read once and the same buffer is parsed and stored
+        data = request.get_data()
+        # Template submissions are rejected before the full parse
+        _prevalidate_cap(data, rules)
+        if pipeline is None:
+            return jsonify({
+                'status_code': 200,
+                'message': process(data)
+            })
+
+        try:
+            expat.ParserCreate().Parse(data, True)
+        except expat.ExpatError as err:
+            raise InvalidUsage(f'Malformed XML: {err}')
+        try:
+            tracking_id = pipeline.submit(data)
+        except QueueFull:
+            raise ServiceUnavailable(
+                'Too many pending alerts, retry later',
+                payload={'retry_after': settings.ws_retry_after})
+        response = jsonify({
+            'status_code': 202,
+            'message': f'queued {tracking_id}',
+            'tracking_id': tracking_id,
+        })
+        response.status_code = 202
+        return response
+
+    @app.route('/status/<tracking_id>', methods=['GET'])
+    @auth.login_required
+    def get_status(tracking_id: str):
+        result = None if pipeline is None else pipeline.status(tracking_id)
+        if result is None:
+            raise GeneralException(f'Unknown {tracking_id}', 404)
+        return jsonify(dict(result, tracking_id=tracking_id))
+
+    @app.route('/alerts', methods=['GET'])
+    @auth.login_required
+    def search_alerts():
+        if store.index is None:
+            raise GeneralException('The archive is not indexed', 404)
+        criteria = {
+            key: request.args[key]
+            for key in ('status', 'event', 'category', 'sender', 'since',
+                        'until')
+            if key in request.args
+        }
+        try:
+            alerts = store.index.search(
+                limit=int(request.args.get('limit', 100)), **criteria)
+        except ValueError as err:
+            raise InvalidUsage(str(err))
+        return jsonify({
+            'status_code': 200,
+            'alerts': alerts,
+        })
+
+    @app.route('/alerts/<identifier>', methods=['GET'])
+    @auth.login_required
+    def fetch_alert(identifier: str):
+        content = store.read(identifier)
+        if content is None:
+            raise GeneralException(f'Unknown {identifier}', 404)
+        return Response(content, mimetype='application/xml')
+
+    @app.errorhandler(GeneralException)
+    def handle_error(
+        error: GeneralException,
+    ):
+        """Return json response for invalid response"""
+        response = jsonify(error.to_dict())
+        response.status_code = error.status_code
+        if isinstance(error, ServiceUnavailable):
+            response.headers['Retry-After'] = str(settings.ws_retry_after)
+        return response
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def handle_too_large(
+        error: RequestEntityTooLarge,
+    ):
+        """Return json response for oversized bodies"""
+        return handle_error(GeneralException(
+            f'Body larger than {settings.ws_max_content_length} bytes',
+            413))
+
+    return app
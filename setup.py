@@ -158,7 +158,11 @@ setup(
     # Similar tdetectmust be valid existing
     # projects.detect
     extras_require={  # Optional
+        'async': [
+            'httpx',
+        ],
         'dev': [
+            'httpx',
             'pytest',
             'pytest-socket',
             'pytest-cov',
@@ -192,6 +196,8 @@ setup(
     entry_points={  # Optional
         'console_scripts': [
             'ravealert=pyravealert.bin.ravealert:main',
+            'ravealert-ws=pyravealert.bin.ravealert_ws:main',
+            'ravealert-archive=pyravealert.bin.ravealert_archive:main',
         ],
     },
 
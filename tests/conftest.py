@@ -0,0 +1,30 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from pathlib import Path
+
+import pytest
+
+from pyravealert.config import AppSettings, get_app_settings
+
+
+# settings changed by the ravealert command from its options
+CLI_SETTINGS = [
+    'url', 'username', 'password', 'connect_timeout', 'read_timeout',
+    'retries', 'deadline', 'outbox', 'log_level',
+]
+
+
+@pytest.fixture
+def cli_settings(monkeypatch, tmp_path: Path) -> AppSettings:
+    '''
+    Settings restored after the test, not forwarding to a daemon
+    '''
+    settings = get_app_settings()
+    for name in CLI_SETTINGS:
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+    monkeypatch.setattr(settings, 'outbox', None)
+    monkeypatch.setattr(
+        settings, 'daemon_socket', str(tmp_path.joinpath('daemon.sock')))
+    monkeypatch.setattr(settings, 'daemon_forward', False)
+    return settings
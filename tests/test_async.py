@@ -0,0 +1,54 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import asyncio
+
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from typing import List
+
+from pyravealert.inbound import generate, AsyncInboundClient
+
+
+class CAPListener(BaseHTTPRequestHandler):
+    '''Local stand-in for the Rave inbound CAP listener'''
+    received: List[bytes] = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.received.append(body)
+        self.send_response(500 if b'Reject' in body else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_async_send_many():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CAPListener)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}/'
+
+    alerts = [generate(headline=f'Region {i}') for i in range(4)]
+    alerts.append(generate(headline='Reject'))
+
+    async def run():
+        async with AsyncInboundClient(
+            url, 'user', 'pass', timeout=5, concurrency=2
+        ) as client:
+            return await client.send_many(alerts)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert len(CAPListener.received) == 5
+    assert [r.identifier for r in results] == \
+        [a.identifier for a in alerts]
+    assert all(r.ok for r in results[:4])
+    assert results[4].status_code == 500
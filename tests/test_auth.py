@@ -0,0 +1,31 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from werkzeug.security import generate_password_hash
+
+from pyravealert.auth import CredentialStore, is_password_hash
+
+
+def test_credential_store():
+    store = CredentialStore({
+        'plain': 'secret',
+        'hashed': generate_password_hash('other'),
+    })
+
+    assert all(is_password_hash(h) for h in store.hashes.values())
+    assert store.verify('plain', 'secret')
+    assert store.verify('hashed', 'other')
+    assert not store.verify('plain', 'other')
+    assert not store.verify('unknown', 'secret')
+
+
+def test_credential_store_cache(monkeypatch):
+    store = CredentialStore({'user': 'secret'}, ttl=60)
+    assert store.verify('user', 'secret')
+
+    # Cached verifications do not reach the key derivation
+    def fail(*args):
+        raise AssertionError('password hash checked')
+
+    monkeypatch.setattr('pyravealert.auth.check_password_hash', fail)
+    assert store.verify('user', 'secret')
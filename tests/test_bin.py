@@ -3,17 +3,27 @@
 '''
 import logging
 
+import os
+
+import subprocess
+
+import sys
+
+from pathlib import Path
+
+from typing import List, Set
+
 from click.testing import CliRunner
 
 from requests_mock.mocker import Mocker
 
-from pyravealert.config import get_app_settings
+from pyravealert.config import AppSettings
 
 from pyravealert.bin import ravealert
 
 
-def test_rave_cli(requests_mock: Mocker):
-    settings = get_app_settings()
+def test_rave_cli(cli_settings: AppSettings, requests_mock: Mocker):
+    settings = cli_settings
 
     requests_mock.post(settings.url)
 
@@ -24,3 +34,155 @@ def test_rave_cli(requests_mock: Mocker):
 
     assert result.exit_code == 0
     assert requests_mock.called_once
+
+
+def test_rave_cli_outbox(
+    cli_settings: AppSettings,
+    tmp_path: Path,
+    requests_mock: Mocker,
+):
+    settings = cli_settings
+    outbox = str(tmp_path.joinpath('outbox.sqlite'))
+
+    requests_mock.post(settings.url, status_code=400)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ravealert.main, ['--outbox', outbox, '--retries', '0', '-e', 'Test'])
+    assert result.exit_code != 0
+
+    result = runner.invoke(
+        ravealert.main, ['--outbox', outbox, 'outbox', 'list'])
+    assert '\tfailed\t' in result.output
+
+    requests_mock.post(settings.url)
+    result = runner.invoke(
+        ravealert.main, ['--outbox', outbox, 'outbox', 'replay'])
+    assert result.output == '1 entries pending\n'
+    result = runner.invoke(
+        ravealert.main, ['--outbox', outbox, 'outbox', 'drain'])
+    assert result.output.startswith('1 delivered')
+
+
+def _imported(args: List[str]) -> Set[str]:
+    '''
+    Modules imported running the ravealert command in a new interpreter
+    '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'from pyravealert.bin.ravealert import main; '
+         f'main({args!r}, standalone_mode=False)'],
+        env=env, capture_output=True, text=True, check=True)
+    return {
+        line.split('|')[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith('import time:')
+    }
+
+
+def test_rave_cli_lazy_imports():
+    # the help (and option parsing) must not pay for the HTTP stack
+    imported = _imported(['--help'])
+    for module in [
+        'requests', 'httpx', 'asyncio', 'sqlite3',
+        'pyravealert.client', 'pyravealert.outbox', 'pyoasiscap.cap',
+    ]:
+        assert module not in imported
+
+    # nor a single alert for the bulk loading
+    imported = _imported(['-e', 'Test', '--stdout-only'])
+    for module in [
+        'pyravealert.bulk', 'concurrent.futures', 'multiprocessing',
+    ]:
+        assert module not in imported
+
+
+def test_rave_cli_files(
+    cli_settings: AppSettings,
+    tmp_path: Path,
+    requests_mock: Mocker,
+):
+    from pyoasiscap.cap import to_string
+
+    from pyravealert.inbound import generate
+
+    settings = cli_settings
+    requests_mock.post(settings.url)
+
+    documents = [to_string(generate(headline=f'File {i}')) for i in range(3)]
+    for i, document in enumerate(documents):
+        tmp_path.joinpath(f'{i}.xml').write_text(document)
+    tmp_path.joinpath('invalid.xml').write_text('<alert>')
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ravealert.main, ['--file', str(tmp_path), '--jobs', '2'])
+    assert result.exit_code == 1
+    assert result.output.count('\tsent 200\n') == 3
+    assert 'invalid.xml\t-\tinvalid' in result.output
+    assert result.output.splitlines()[-1].startswith(
+        '3 sent, 0 failed, 1 invalid')
+
+    outbox = str(tmp_path.joinpath('outbox.sqlite'))
+    result = runner.invoke(
+        ravealert.main, ['--outbox', outbox, '--file', str(tmp_path)])
+    assert result.exit_code == 1
+    assert result.output.count('\tqueued\n') == 3
+    assert 'alerts/s)' in result.output.splitlines()[-1]
+
+    stdin = '\0'.join(documents[:2]) + documents[2]
+    result = runner.invoke(
+        ravealert.main, ['--file', '-', '--stdout-only'], input=stdin)
+    assert result.exit_code == 0
+    assert result.output.count('<alert') == 3
+
+
+def test_ws_cli_async_workers(monkeypatch):
+    from pyravealert.bin import ravealert_ws
+
+    options = []
+    monkeypatch.setattr(
+        ravealert_ws.WSApplication, 'run',
+        lambda self: options.append(self.options))
+    monkeypatch.setattr(ravealert_ws.settings, 'ws_workers', 2)
+
+    runner = CliRunner()
+    result = runner.invoke(ravealert_ws.main, [])
+    assert result.exit_code == 0
+    assert options.pop()['workers'] == 2
+
+    monkeypatch.setattr(ravealert_ws.settings, 'ws_async', True)
+    result = runner.invoke(ravealert_ws.main, [])
+    assert result.exit_code == 0
+    assert options.pop()['workers'] == 1
+    result = runner.invoke(ravealert_ws.main, ['--workers', '4'])
+    assert result.exit_code == 2
+    assert not options
+
+
+def test_archive_cli_without_index(tmp_path: Path, monkeypatch):
+    from pyoasiscap.cap import to_string
+
+    from pyravealert.bin import ravealert_archive
+
+    from pyravealert.inbound import generate
+
+    from pyravealert.storage import AlertStore
+
+    monkeypatch.setattr(ravealert_archive.settings, 'ws_index', False)
+    alert = generate(headline='Stored')
+    content = to_string(alert).encode()
+    AlertStore(str(tmp_path)).write('Test', alert.identifier, content, alert)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ravealert_archive.main,
+        ['--directory', str(tmp_path), 'fetch', alert.identifier])
+    assert result.exit_code == 0
+    assert result.stdout_bytes == content
+    result = runner.invoke(
+        ravealert_archive.main, ['--directory', str(tmp_path), 'list'])
+    assert result.exit_code == 1
+    assert 'index is disabled' in result.output
+    assert not tmp_path.joinpath('index.sqlite').exists()
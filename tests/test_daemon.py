@@ -0,0 +1,126 @@
+'''
+.. codeauthor:: Charles Blais
+'''
+import threading
+
+from pathlib import Path
+
+import pytest
+
+from click.testing import CliRunner
+
+from requests_mock.mocker import Mocker
+
+from pyravealert.config import AppSettings
+
+from pyravealert.daemon import Daemon, forward
+
+from pyravealert.bin import ravealert
+
+
+def _start(path: str, handler) -> Daemon:
+    daemon = Daemon(path, handler)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    return daemon
+
+
+def test_daemon(tmp_path: Path):
+    path = str(tmp_path.joinpath('daemon.sock'))
+    assert forward(path, {}, timeout=1) is None
+
+    def handler(request):
+        if request.get('fail'):
+            raise ValueError('invalid')
+        return {'echo': request['value']}
+
+    daemon = _start(path, handler)
+    try:
+        assert forward(path, {'value': 1}, timeout=1) == {'echo': 1}
+        assert forward(path, {'fail': True}, timeout=1) == {
+            'error': 'invalid'}
+        with pytest.raises(RuntimeError):
+            Daemon(path, handler)
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+    assert not Path(path).exists()
+
+
+def test_rave_cli_daemon(
+    cli_settings: AppSettings,
+    monkeypatch,
+    requests_mock: Mocker,
+):
+    settings = cli_settings
+    monkeypatch.setattr(settings, 'daemon_forward', True)
+    path = settings.daemon_socket
+
+    requests_mock.post(settings.url)
+
+    forwarded = []
+
+    def handler(request):
+        forwarded.append(request)
+        return ravealert._serve_request(request)
+
+    daemon = _start(path, handler)
+    try:
+        runner = CliRunner()
+        result = runner.invoke(ravealert.main, ['-e', 'Test'])
+        assert result.exit_code == 0
+        assert forwarded[0]['alert']['event'] == 'Test'
+        assert requests_mock.called_once
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+
+    # without daemon the alert is sent in-process
+    result = runner.invoke(ravealert.main, ['-e', 'Test'])
+    assert result.exit_code == 0
+    assert requests_mock.call_count == 2
+    assert len(forwarded) == 1
+
+
+def test_rave_cli_daemon_file(
+    cli_settings: AppSettings,
+    monkeypatch,
+    tmp_path: Path,
+    requests_mock: Mocker,
+):
+    from pyoasiscap.cap import to_string
+
+    from pyravealert.inbound import generate
+
+    settings = cli_settings
+    monkeypatch.setattr(settings, 'daemon_forward', True)
+    path = settings.daemon_socket
+
+    requests_mock.post(settings.url)
+
+    # the file is parsed by the daemon, in its declared encoding
+    document = to_string(generate(headline='Zażółć')).replace(
+        'encoding="UTF-8"', 'encoding="ISO-8859-2"')
+    file = tmp_path.joinpath('alert.xml')
+    file.write_bytes(document.encode('iso-8859-2'))
+
+    forwarded = []
+
+    def handler(request):
+        forwarded.append(request)
+        return ravealert._serve_request(request)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ravealert.main, ['--file', str(tmp_path.joinpath('missing.xml'))])
+    assert result.exit_code == 2
+
+    daemon = _start(path, handler)
+    try:
+        result = runner.invoke(
+            ravealert.main, ['--file', str(file), '--retries', '0'])
+        assert result.exit_code == 0
+        assert forwarded[0]['retries'] == 0
+        assert 'Zażółć' in requests_mock.last_request.text
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
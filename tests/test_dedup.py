@@ -0,0 +1,32 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from pathlib import Path
+
+from pyravealert.dedup import DedupIndex
+
+
+def test_dedup_lru():
+    index = DedupIndex(size=2)
+    index.add('a')
+    index.add('b')
+    assert 'a' in index
+    index.add('c')
+
+    # b was the least recently used
+    assert 'a' in index
+    assert 'b' not in index
+    assert 'c' in index
+
+
+def test_dedup_persistent(tmp_path: Path):
+    path = str(tmp_path.joinpath('dedup.sqlite'))
+    index = DedupIndex(size=1, path=path)
+    index.add('a')
+    index.add('b')
+    index.close()
+
+    index = DedupIndex(size=1, path=path)
+    assert 'a' in index
+    assert 'b' in index
+    assert 'c' not in index
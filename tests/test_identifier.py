@@ -0,0 +1,37 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pyravealert.identifier import IdentifierGenerator, LegacyIdentifier, \
+    SortableIdentifier, get_hostname
+
+
+def test_legacy_identifier():
+    identifier = LegacyIdentifier()()
+    assert identifier.startswith(f'{get_hostname()}-')
+    assert len(identifier.split('-')[-1]) == 5
+
+
+def test_sortable_identifier():
+    generator = SortableIdentifier()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        identifiers = list(executor.map(
+            lambda _: [generator() for _ in range(1000)], range(8)))
+
+    flat = [i for chunk in identifiers for i in chunk]
+    assert len(set(flat)) == len(flat)
+    # Each thread sees increasing identifiers
+    for chunk in identifiers:
+        assert chunk == sorted(chunk)
+
+
+def test_identifier_strategy_call():
+    class Incomplete(IdentifierGenerator):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore
@@ -0,0 +1,45 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from pathlib import Path
+
+from pyoasiscap.alert import Status
+
+from pyoasiscap.cap import to_string
+
+from pyoasiscap.info import Category
+
+from pyravealert.inbound import generate
+
+from pyravealert.storage import AlertStore
+
+
+def test_index(tmp_path: Path):
+    store = AlertStore(str(tmp_path), index=True)
+    assert store.index is not None
+
+    alerts = [
+        generate(status=Status.test, event='Earthquake'),
+        generate(
+            status=Status.actual, event='Tsunami',
+            category=[Category.geo, Category.met]),
+    ]
+    for alert in alerts:
+        store.write(
+            alert.status.value, alert.identifier,
+            to_string(alert).encode(), alert)
+
+    assert [a['event'] for a in store.index.search()] == [
+        'Tsunami', 'Earthquake']
+    assert [a['event'] for a in store.index.search(category='met')] == [
+        'Tsunami']
+    assert store.index.search(status='Test', event='Tsunami') == []
+    assert store.index.search(until='2000-01-01T00:00:00') == []
+    assert store.index.get(alerts[0].identifier)['status'] == 'Test'
+    assert store.read(alerts[1].identifier) == to_string(alerts[1]).encode()
+
+    # the files are enough to rebuild the index or read without it
+    assert store.reindex() == 2
+    assert len(store.index.search()) == 2
+    assert AlertStore(str(tmp_path)).read(alerts[0].identifier) \
+        == to_string(alerts[0]).encode()
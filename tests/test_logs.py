@@ -0,0 +1,64 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import logging
+
+from pyravealert import logs
+
+
+class Payload:
+    '''Payload counting how many times it is formatted'''
+    formatted = 0
+
+    def __str__(self):
+        Payload.formatted += 1
+        return '<alert/>'
+
+
+def test_rate_limit_filter():
+    limit = logs.RateLimitFilter(rate=2)
+    records = [
+        logging.LogRecord('test', logging.DEBUG, '', 0, 'payload', (), None)
+        for _ in range(5)]
+
+    assert [limit.filter(r) for r in records[:3]] == [True, True, False]
+    limit._tokens = 1
+    assert limit.filter(records[3])
+    assert records[3].msg == '(1 payloads suppressed) payload'
+
+    # one payload every 2 seconds
+    limit = logs.RateLimitFilter(rate=0.5)
+    assert [limit.filter(r) for r in records[:2]] == [True, False]
+    limit._last -= 2
+    assert limit.filter(records[2])
+
+
+def test_structured_logging(caplog, monkeypatch):
+    monkeypatch.setattr(logs, '_structured', True)
+    monkeypatch.setattr(logs.payload_logger, 'level', logging.WARNING)
+    caplog.set_level(logging.INFO)
+
+    logs.log_payload('Sending CAP to Rave', Payload())
+    logs.log_event('Sent CAP to Rave', 'abc', 100, 0.5)
+
+    # The payload is never formatted when the payload logger is disabled
+    assert Payload.formatted == 0
+    assert caplog.messages == [
+        'Sent CAP to Rave identifier=abc size=100 latency=0.500']
+
+
+def test_queue_listener():
+    logger = logging.getLogger('pyravealert.test')
+    logger.propagate = False
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append  # type: ignore
+    logger.addHandler(handler)
+
+    listener = logs.start_queue_listener(logger)
+    assert listener is not None
+    assert logs.start_queue_listener(logger) is None
+    logger.warning('queued')
+    listener.stop()
+
+    assert [r.getMessage() for r in records] == ['queued']
@@ -0,0 +1,75 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import time
+
+from pathlib import Path
+
+import requests
+
+from requests_mock.mocker import Mocker
+
+from pyravealert.config import get_app_settings
+
+from pyravealert.inbound import InboundClient
+
+from pyravealert.outbox import Outbox, DELIVERED, FAILED, IN_FLIGHT, PENDING
+
+
+def test_outbox_drain(tmp_path: Path, requests_mock: Mocker):
+    settings = get_app_settings()
+    path = str(tmp_path.joinpath('outbox.sqlite'))
+    client = InboundClient(settings.url, 'user', 'pass', retries=0)
+
+    outbox = Outbox(path, batch=2)
+    for i in range(5):
+        outbox.put(f'alert-{i}', f'<alert>{i}</alert>')
+    outbox.close()
+
+    # Listener down, the first batch fails and draining stops
+    requests_mock.post(settings.url, status_code=503)
+    outbox = Outbox(path, batch=2)
+    assert outbox.drain(client) == {DELIVERED: 0, FAILED: 0, PENDING: 2}
+
+    def callback(request, context):
+        context.status_code = 400 if request.text == '<alert>3</alert>' \
+            else 200
+        return ''
+
+    requests_mock.post(settings.url, text=callback)
+    assert outbox.drain(client) == {DELIVERED: 4, FAILED: 1, PENDING: 0}
+    assert [e['identifier'] for e in outbox.list(state=FAILED)] == \
+        ['alert-3']
+
+    assert outbox.replay() == 1
+    assert [e['identifier'] for e in outbox.list(state=PENDING)] == \
+        ['alert-3']
+
+
+def test_outbox_claim(tmp_path: Path, requests_mock: Mocker):
+    settings = get_app_settings()
+    path = str(tmp_path.joinpath('outbox.sqlite'))
+    client = InboundClient(settings.url, 'user', 'pass', retries=0)
+
+    outbox = Outbox(path, batch=10)
+    for i in range(5):
+        outbox.put(f'alert-{i}', f'<alert>{i}</alert>')
+
+    # Entries claimed by another drain are not posted twice
+    other = Outbox(path, batch=2, lease=0.5)
+    assert [row['identifier'] for row in other._claim(0, None)] == \
+        ['alert-0', 'alert-1']
+    assert len(outbox.list(state=IN_FLIGHT)) == 2
+
+    # Listener unreachable, the remaining entries are not posted
+    requests_mock.post(settings.url, exc=requests.ConnectTimeout)
+    assert outbox.drain(client, concurrency=1) == {
+        DELIVERED: 0, FAILED: 0, PENDING: 3}
+    assert requests_mock.call_count == 1
+    assert len(outbox.list(state=PENDING)) == 3
+
+    # The expired lease of the other drain is claimed again
+    time.sleep(0.5)
+    requests_mock.post(settings.url)
+    assert other.drain(client) == {DELIVERED: 5, FAILED: 0, PENDING: 0}
+    assert requests_mock.call_count == 6
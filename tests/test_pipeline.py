@@ -0,0 +1,51 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import threading
+
+import pytest
+
+from pyravealert.pipeline import Pipeline, QueueFull, DONE, FAILED
+
+
+class Rejected(Exception):
+    status_code = 400
+    message = 'rejected'
+
+
+def handler(data: bytes) -> str:
+    if data == b'bad':
+        raise Rejected()
+    return data.decode()
+
+
+def test_pipeline():
+    pipeline = Pipeline(handler, size=10, workers=2)
+    good = pipeline.submit(b'good')
+    bad = pipeline.submit(b'bad')
+    pipeline.close()
+
+    assert pipeline.status(good) == \
+        {'state': DONE, 'status_code': 200, 'message': 'good'}
+    assert pipeline.status(bad) == \
+        {'state': FAILED, 'status_code': 400, 'message': 'rejected'}
+    assert pipeline.status('unknown') is None
+
+
+def test_pipeline_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking(data: bytes) -> str:
+        started.set()
+        release.wait()
+        return ''
+
+    pipeline = Pipeline(blocking, size=1, workers=1)
+    pipeline.submit(b'processing')
+    started.wait()
+    pipeline.submit(b'queued')
+    with pytest.raises(QueueFull):
+        pipeline.submit(b'rejected')
+    release.set()
+    pipeline.close()
@@ -1,13 +1,25 @@
 '''
 ..  codeauthor:: Charles Blais
 '''
+import time
+
+import pytest
+
+import requests
 
 from requests_mock.mocker import Mocker
 
-from pyravealert.inbound import generate, send
+from pyoasiscap.cap import to_string, from_string
+
+from pyoasiscap.info import Category
+
+from pyravealert.inbound import generate, send, send_many, InboundClient, \
+    AlertTemplate
 
 from pyravealert.config import get_app_settings
 
+from pyravealert.dedup import DedupIndex
+
 
 def test_generate():
     alert = generate(headline='Testing')
@@ -35,3 +47,152 @@ def test_send(requests_mock: Mocker):
     print(requests_mock.request_history[0].text)
     assert '<alert xmlns="urn:oasis:names:tc:emergency:cap:1.2">' \
         in requests_mock.request_history[0].text
+
+
+def test_inbound_client(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    requests_mock.post(settings.url)
+
+    with InboundClient(
+        settings.url, 'user', 'pass', pool_size=2
+    ) as client:
+        client.send(generate(headline='First'))
+        client.send(generate(headline='Second'))
+
+    assert requests_mock.call_count == 2
+    for history in requests_mock.request_history:
+        assert history.headers['Authorization'].startswith('Basic ')
+        assert history.headers['Content-Type'] == 'application/xml'
+
+
+def test_send_many(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    alerts = [generate(headline=f'Region {i}') for i in range(5)]
+    failing = alerts[2].identifier
+
+    def callback(request, context):
+        context.status_code = 400 if failing in request.text else 200
+        return ''
+
+    requests_mock.post(settings.url, text=callback)
+
+    results = send_many(alerts, settings.url, 'user', 'pass', concurrency=3)
+
+    assert requests_mock.call_count == 5
+    assert [r.identifier for r in results] == \
+        [a.identifier for a in alerts]
+    assert [r.status_code for r in results] == [200, 200, 400, 200, 200]
+    assert not results[2].ok
+    assert all(r.ok for i, r in enumerate(results) if i != 2)
+
+
+def test_send_retry(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    requests_mock.post(settings.url, [
+        {'status_code': 503},
+        {'exc': requests.ConnectTimeout},
+        {'status_code': 200},
+    ])
+
+    client = InboundClient(
+        settings.url, 'user', 'pass', retries=3, backoff_factor=0.01)
+    assert client.send(generate(headline='Testing')).status_code == 200
+    assert requests_mock.call_count == 3
+
+    # the listener may have accepted the alert, it is not sent again
+    requests_mock.post(settings.url, [
+        {'exc': requests.ReadTimeout},
+        {'status_code': 200},
+    ])
+    with pytest.raises(requests.ReadTimeout):
+        client.send(generate(headline='Testing'))
+    assert requests_mock.call_count == 4
+
+
+def test_send_deadline(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    requests_mock.post(settings.url, status_code=503)
+
+    client = InboundClient(
+        settings.url, 'user', 'pass',
+        retries=100, backoff_factor=0.05, deadline=0.2)
+    start = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        client.send(generate(headline='Testing'))
+    assert time.monotonic() - start < 0.5
+    assert 1 < requests_mock.call_count < 100
+
+
+def test_send_no_retry_client_error(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    requests_mock.post(settings.url, status_code=401)
+
+    client = InboundClient(settings.url, 'user', 'pass', retries=3)
+    with pytest.raises(requests.HTTPError):
+        client.send(generate(headline='Testing'))
+    assert requests_mock.call_count == 1
+
+
+def test_send_dedup(requests_mock: Mocker):
+    settings = get_app_settings()
+
+    requests_mock.post(settings.url)
+
+    client = InboundClient(
+        settings.url, 'user', 'pass', dedup=DedupIndex())
+    alert = generate(headline='Testing')
+    assert client.send(alert) is not None
+    assert client.send(alert) is None
+    results = client.send_many([alert, generate(headline='Other')])
+
+    assert requests_mock.call_count == 2
+    assert [r.duplicate for r in results] == [True, False]
+
+
+def test_alert_template():
+    template = AlertTemplate(
+        event='Earthquake', category=[Category.geo], instruction='Take cover')
+
+    first = template.stamp(headline='Region A', description='EN --- FR')
+    second = template.stamp(headline='Region B')
+
+    assert first.identifier != second.identifier
+    assert first.info[0].headline == 'Region A'
+    assert first.info[0].description == 'EN --- FR'
+    assert second.info[0].headline == 'Region B'
+    assert second.info[0].description is None
+    assert second.info[0].instruction == 'Take cover'
+    assert template.prototype.info[0].headline is None
+    assert first.dict(exclude={'sent'}) == generate(
+        identifier=first.identifier,
+        event='Earthquake',
+        category=[Category.geo],
+        instruction='Take cover',
+        headline='Region A',
+        description='EN --- FR',
+    ).dict(exclude={'sent'})
+
+
+def test_alert_template_render():
+    template = AlertTemplate(
+        event='Earthquake', headline='Default', contact='a & b')
+
+    for headline, description in [
+        (None, None),
+        ('Region <A> & "B"', None),
+        ('Région', 'EN --- FR\nligne'),
+    ]:
+        identifier, xml = template.render(
+            headline=headline, description=description)
+        alert = template.stamp(
+            identifier=identifier,
+            sent=from_string(xml).sent,
+            headline=headline,
+            description=description)
+        assert xml == to_string(alert)
+    assert all(s is not None for s in template._skeletons.values())
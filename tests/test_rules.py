@@ -0,0 +1,114 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import json
+
+from pathlib import Path
+
+import pytest
+
+from pyoasiscap.alert import Status
+
+from pyoasiscap.info import Category
+
+from pyoasiscap.parameter import Parameter
+
+from pyravealert.inbound import generate
+
+from pyravealert.rules import Rule, RuleSet, RuleViolation
+
+
+def _message(rules: RuleSet, **kwargs) -> str:
+    try:
+        rules.validate(generate(**kwargs))
+    except RuleViolation as err:
+        return err.message
+    return ''
+
+
+def test_default_rules():
+    rules = RuleSet.load()
+
+    assert _message(rules, description='EN --- FR') == ''
+    assert _message(rules, description='EN ---- FR') == ''
+    assert _message(rules, description=None).startswith('No <description>')
+    assert _message(rules, description='EN') == \
+        'Must be split by --- characters'
+    assert _message(rules, description='EN --- FR --- ES') == \
+        'Must be split by --- characters'
+    assert _message(rules, description='------') == \
+        'Must be split by --- characters'
+    assert _message(rules, description='Insert a description --- FR') \
+        .startswith('English')
+    assert _message(rules, description='EN ---Insérez une description') \
+        .startswith('French')
+
+    with pytest.raises(RuleViolation):
+        rules.validate_streamed(False, None)
+    rules.validate_streamed(True, 'EN --- FR')
+
+
+def test_scoped_rules(tmp_path: Path):
+    path = tmp_path.joinpath('rules.json')
+    path.write_text(json.dumps([{
+        'field': 'info.web',
+        'operator': 'exists',
+        'message': 'Actual alerts need a link',
+        'status': ['Actual'],
+    }, {
+        'field': 'info.event',
+        'operator': 'one_of',
+        'value': ['Earthquake', 'Tsunami'],
+        'message': 'Unknown geological event',
+        'category': ['Geo'],
+    }, {
+        'field': 'info[0].parameter.valueName',
+        'operator': 'not_matches',
+        'value': '^internal:',
+        'message': 'Internal parameter',
+    }]))
+    rules = RuleSet.load(str(path))
+
+    assert _message(rules, status=Status.test, event='Tsunami') == ''
+    assert _message(rules, status=Status.actual, event='Tsunami') == \
+        'Actual alerts need a link'
+    assert _message(
+        rules, status=Status.actual, event='Tsunami', web='https://x') == ''
+    assert _message(rules, event='Volcano') == 'Unknown geological event'
+    assert _message(rules, event='Volcano', category=[Category.met]) == ''
+    assert _message(rules, event='Earthquake') == ''
+    assert _message(rules, event='Earthquake', parameter=[
+        Parameter(valueName='internal:id', value='1')]) == \
+        'Internal parameter'
+
+    # only the presence of info is known to the streaming pre-validation
+    rules = RuleSet([Rule(
+        field='info', operator='matches', value='Geo', message='Geo')])
+    assert _message(rules) == ''
+    rules.validate_streamed(True, 'EN --- FR')
+
+    with pytest.raises(ValueError):
+        RuleSet([Rule(field='info..x', operator='exists', message='')])
+    with pytest.raises(ValueError):
+        RuleSet([Rule(
+            field='info', operator='matches', value='(', message='')])
+
+
+def test_merged_rules():
+    rules = RuleSet([
+        Rule(field='info.headline', operator='not_matches',
+             value='(?i)^draft', message='Draft'),
+        Rule(field='info.event', operator='not_equals',
+             value='Retired', message='Retired event'),
+        Rule(field='info.headline', operator='not_matches',
+             value=r'(\w+) \1', message='Repeated word'),
+        Rule(field='info.headline', operator='not_matches',
+             value='TODO', message='Unfinished'),
+    ])
+
+    assert _message(rules, headline='Earthquake') == ''
+    assert _message(rules, headline='DRAFT TODO') == 'Draft'
+    assert _message(rules, headline='quake quake') == 'Repeated word'
+    assert _message(rules, headline='TODO') == 'Unfinished'
+    assert _message(rules, event='Retired', headline='TODO') == \
+        'Retired event'
@@ -0,0 +1,79 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import os
+
+import time
+
+from pathlib import Path
+
+from pyoasiscap.cap import to_string
+
+from pyravealert.inbound import generate
+
+from pyravealert.segments import SegmentCatalog, write_segment
+
+from pyravealert.storage import AlertStore
+
+
+def test_compact(tmp_path: Path):
+    store = AlertStore(str(tmp_path), index=True)
+    alerts = [generate(headline=f'Region {i}') for i in range(20)]
+    contents = {}
+    for alert in alerts:
+        contents[alert.identifier] = to_string(alert).encode()
+        filename = store.write(
+            'Test', alert.identifier, contents[alert.identifier], alert)
+        old = time.time() - 2 * 86400
+        os.utime(filename, (old, old))
+    recent = generate(headline='Recent')
+    store.write('Test', recent.identifier, to_string(recent).encode(), recent)
+
+    assert store.compact(older_than=1) == 20
+    assert store.compact(older_than=1) == 0
+    assert [p.name for _, p in store.archived()] == [
+        f'{recent.identifier}.xml']
+    segments = list(tmp_path.joinpath('test', 'segments').glob('*.seg'))
+    assert len(segments) == 1
+    assert segments[0].stat().st_size < sum(map(len, contents.values())) / 2
+
+    # compacted alerts are still found one by one, with or without index
+    identifier = alerts[7].identifier
+    assert store.exists('Test', identifier)
+    assert AlertStore(str(tmp_path)).exists('Test', identifier)
+    assert store.read(identifier) == contents[identifier]
+    assert AlertStore(str(tmp_path)).read(identifier) == contents[identifier]
+    assert store.index is not None
+    assert store.index.get(identifier)['path'].endswith('.seg')
+    assert store.reindex() == 21
+    assert store.read(identifier) == contents[identifier]
+    # current.xml is kept
+    assert store.current_path('Test').exists()
+
+
+def test_catalog_refresh(tmp_path: Path):
+    catalog = SegmentCatalog(tmp_path)
+    write_segment(tmp_path.joinpath('a.seg'), [('a', b'<alert>a</alert>')])
+    assert catalog.read('a') == b'<alert>a</alert>'
+
+    # a segment added within the same directory timestamp is found
+    stat = tmp_path.stat()
+    write_segment(tmp_path.joinpath('b.seg'), [('b', b'<alert>b</alert>')])
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert catalog.read('b') == b'<alert>b</alert>'
+    assert sorted(catalog.identifiers()) == ['a', 'b']
+    assert tmp_path.joinpath('.catalog').read_text() == 'a.seg\nb.seg\n'
+
+
+def test_catalog_lookup_no_listing(tmp_path: Path, monkeypatch):
+    catalog = SegmentCatalog(tmp_path)
+    write_segment(tmp_path.joinpath('a.seg'), [('a', b'<alert>a</alert>')])
+    assert catalog.locate('a') is not None
+
+    # without new segment, a lookup does not list the directory
+    def listdir(path):
+        raise AssertionError(f'{path} listed')
+
+    monkeypatch.setattr(os, 'listdir', listdir)
+    assert catalog.locate('a') is not None
+    assert catalog.locate('missing') is None
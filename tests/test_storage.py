@@ -0,0 +1,97 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from pathlib import Path
+
+import pytest
+
+from pyravealert.config import FsyncPolicy
+
+from pyravealert.storage import AlertStore
+
+
+def test_store_write(tmp_path: Path):
+    store = AlertStore(str(tmp_path))
+
+    first = store.write('Actual', 'first', b'<alert>first</alert>')
+    second = store.write('Actual', 'second', b'<alert>second</alert>')
+
+    current = store.current_path('Actual')
+    assert current == tmp_path.joinpath('actual', 'current.xml')
+    assert current.read_bytes() == b'<alert>second</alert>'
+    assert first.read_bytes() == b'<alert>first</alert>'
+    assert second.parent == tmp_path.joinpath('actual', 'archive')
+    assert sorted(p.name for p in tmp_path.joinpath('actual').iterdir()) \
+        == ['archive', 'current.xml']
+
+
+def test_store_write_same_identifier(tmp_path: Path):
+    store = AlertStore(str(tmp_path))
+
+    store.write('Test', 'same', b'<alert/>')
+    store.write('Test', 'same', b'<alert/>')
+
+    assert sorted(p.name for p in tmp_path.joinpath('test').iterdir()) \
+        == ['archive', 'current.xml']
+
+
+def test_store_write_fsync(tmp_path: Path):
+    store = AlertStore(str(tmp_path), fsync=FsyncPolicy.FILE_DIR)
+
+    filename = store.write('Test', 'durable', b'<alert/>')
+
+    assert filename.read_bytes() == b'<alert/>'
+    assert [p.name for p in filename.parent.iterdir()] == ['durable.xml']
+
+
+def test_store_layout_migrate(tmp_path: Path):
+    from pyoasiscap.cap import to_string
+
+    from pyravealert.config import ArchiveLayout
+
+    from pyravealert.inbound import generate
+
+    store = AlertStore(str(tmp_path), index=True)
+    alert = generate().copy(update={'sent': '2022-08-08T23:30:00-02:00'})
+    content = to_string(alert).encode()
+    flat = store.write('Test', alert.identifier, content, alert)
+    assert flat.parent == tmp_path.joinpath('test', 'archive')
+
+    store.layout = ArchiveLayout.DATE
+    assert store.migrate() == 1
+    dated = tmp_path.joinpath(
+        'test', 'archive', '2022', '08', '09', f'{alert.identifier}.xml')
+    assert dated.read_bytes() == content
+    assert store.exists('Test', alert.identifier, alert.sent)
+    assert store.read(alert.identifier) == content
+    assert store.migrate() == 0
+
+    store.layout = ArchiveLayout.HASH
+    assert store.migrate() == 1
+    assert store.exists('Test', alert.identifier)
+    assert store.read(alert.identifier) == content
+    assert AlertStore(str(tmp_path), layout=ArchiveLayout.HASH).read(
+        alert.identifier) == content
+    # the emptied date shards are removed
+    assert not tmp_path.joinpath('test', 'archive', '2022').exists()
+
+
+def test_store_date_layout_resubmit(tmp_path: Path):
+    from pyoasiscap.cap import to_string
+
+    from pyravealert.config import ArchiveLayout
+
+    from pyravealert.inbound import generate
+
+    with pytest.raises(ValueError):
+        AlertStore(str(tmp_path), layout=ArchiveLayout.DATE)
+
+    store = AlertStore(str(tmp_path), index=True, layout=ArchiveLayout.DATE)
+    alert = generate().copy(update={'sent': '2024-01-01T12:00:00+00:00'})
+    store.write('Test', alert.identifier, to_string(alert).encode(), alert)
+
+    # the same identifier sent another day is a duplicate
+    assert store.exists(
+        'Test', alert.identifier, '2024-01-02T12:00:00+00:00')
+    assert not store.exists(
+        'Actual', alert.identifier, '2024-01-01T12:00:00+00:00')
@@ -0,0 +1,144 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+import base64
+
+import time
+
+from pathlib import Path
+
+import pytest
+
+from flask.testing import FlaskClient
+
+from pyravealert.config import get_app_settings
+
+from pyravealert.ws import create_app
+
+
+EXAMPLE = Path(__file__).parent.joinpath('examples', 'gds_example.xml')
+
+AUTH = {
+    'Authorization': 'Basic ' + base64.b64encode(b'user:pass').decode()
+}
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch) -> FlaskClient:
+    settings = get_app_settings()
+    monkeypatch.setattr(settings, 'ws_basic_auth', {'user': 'pass'})
+    monkeypatch.setattr(settings, 'ws_write_directory', str(tmp_path))
+    monkeypatch.setattr(settings, 'ws_log_queue', False)
+    return create_app().test_client()
+
+
+def example(description: str) -> bytes:
+    return EXAMPLE.read_bytes().replace(
+        b'An earthquake of magnitude', description.encode('utf-8'), 1)
+
+
+def test_post_cap(client: FlaskClient, tmp_path: Path):
+    response = client.post('/', data=example('EN --- FR'), headers=AUTH)
+
+    assert response.status_code == 200
+    current = tmp_path.joinpath('actual', 'current.xml')
+    assert b'EN --- FR' in current.read_bytes()
+
+
+def test_post_cap_invalid(client: FlaskClient):
+    response = client.post('/', data=example('No separator'), headers=AUTH)
+    assert response.status_code == 400
+
+    response = client.post('/', data=example('EN --- FR'))
+    assert response.status_code == 401
+
+
+def test_post_cap_async(tmp_path: Path, monkeypatch):
+    settings = get_app_settings()
+    monkeypatch.setattr(settings, 'ws_basic_auth', {'user': 'pass'})
+    monkeypatch.setattr(settings, 'ws_write_directory', str(tmp_path))
+    monkeypatch.setattr(settings, 'ws_async', True)
+    monkeypatch.setattr(settings, 'ws_log_queue', False)
+    client = create_app().test_client()
+
+    response = client.post('/', data=b'<alert>', headers=AUTH)
+    assert response.status_code == 400
+
+    response = client.post('/', data=example('EN --- FR'), headers=AUTH)
+    assert response.status_code == 202
+    tracking_id = response.get_json()['tracking_id']
+
+    for _ in range(100):
+        status = client.get(f'/status/{tracking_id}', headers=AUTH)
+        if status.get_json()['state'] != 'pending':
+            break
+        time.sleep(0.01)
+    assert status.get_json()['state'] == 'done'
+    assert tmp_path.joinpath('actual', 'current.xml').exists()
+
+
+def test_post_cap_too_large(client: FlaskClient):
+    settings = get_app_settings()
+    data = b' ' * (settings.ws_max_content_length + 1)
+
+    response = client.post('/', data=data, headers=AUTH)
+
+    assert response.status_code == 413
+    assert response.get_json()['status_code'] == 413
+
+
+def test_post_cap_latin2(client: FlaskClient, tmp_path: Path):
+    data = example('EN --- FR é').replace(b'\xc3\xa9', 'é'.encode('latin2'))
+
+    response = client.post('/', data=data, headers=AUTH)
+
+    assert response.status_code == 200
+    assert tmp_path.joinpath('actual', 'current.xml').read_bytes() == data
+
+
+def test_post_cap_duplicate(client: FlaskClient, tmp_path: Path):
+    response = client.post('/', data=example('EN --- FR'), headers=AUTH)
+    assert response.status_code == 200
+
+    response = client.post('/', data=example('EN --- changed'), headers=AUTH)
+    assert response.status_code == 200
+    assert response.get_json()['message'].startswith('already uploaded')
+    current = tmp_path.joinpath('actual', 'current.xml')
+    assert b'EN --- FR' in current.read_bytes()
+
+
+def test_search_alerts(client: FlaskClient):
+    data = example('EN --- FR')
+    client.post('/', data=data, headers=AUTH)
+
+    response = client.get(
+        '/alerts?status=actual&category=Geo&since=2022-08-08', headers=AUTH)
+    assert response.status_code == 200
+    alerts = response.get_json()['alerts']
+    assert [alert['event'] for alert in alerts] == ['Earthquake']
+
+    response = client.get('/alerts?since=2022-08-09', headers=AUTH)
+    assert response.get_json()['alerts'] == []
+    response = client.get('/alerts?since=yesterday', headers=AUTH)
+    assert response.status_code == 400
+
+    response = client.get(f'/alerts/{alerts[0]["identifier"]}', headers=AUTH)
+    assert response.status_code == 200
+    assert response.data == data
+    response = client.get('/alerts/unknown', headers=AUTH)
+    assert response.status_code == 404
+
+
+def test_post_cap_prevalidate(client: FlaskClient):
+    data = EXAMPLE.read_bytes()
+    start = data.index(b'<description>')
+    end = data.index(b'</description>') + len(b'</description>')
+    response = client.post(
+        '/', data=data[:start] + data[end:], headers=AUTH)
+    assert response.status_code == 400
+    assert 'description' in response.get_json()['message']
+
+    response = client.post(
+        '/', data=example('Insert a description --- FR'), headers=AUTH)
+    assert response.status_code == 400
+    assert response.get_json()['message'].startswith('English')